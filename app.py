@@ -6,10 +6,27 @@ from threading import Thread
 from flask import Flask
 from controllers.controller import BootstrapController, NodeController
 from constants import Constants
-from helper import myIP, BootstrapConnError
+from helper import myIP, BootstrapConnError, RestoreError, ConfigError
+import config
 
 def start_app(app, args):
-    app.run(host="0.0.0.0", port=Constants.BOOTSTRAP_PORT if args.bootstrap else args.port)
+    app.run(host="0.0.0.0", port=port(args))
+
+def port(args):
+    return Constants.BOOTSTRAP_PORT if args.bootstrap else args.port
+
+def create_controller(args, loop=None):
+    try:
+        if args.bootstrap:
+            return BootstrapController(args.file, args.restart, loop)
+        return NodeController(myIP(), args.port, args.file, args.restart, loop)
+    except (BootstrapConnError, RestoreError) as e:
+        logging.error(e)
+        return None
+
+def start_user_interface(controller):
+    print("\nMy pubkey: ...{}...\n".format(controller.node.public_key[100:110]))
+    user_interface(controller.node, "")
 
 def user_interface(node, prompt_str=">>> "):
     while True:
@@ -28,13 +45,40 @@ parser.add_argument("-b", "--bootstrap", action = argparse.BooleanOptionalAction
 parser.add_argument("-p", "--port", nargs = "?", const = "8000", default = "8000")
 parser.add_argument("-o", "--okeanos", action = argparse.BooleanOptionalAction, default = False)
 parser.add_argument("-f", "--file", action = argparse.BooleanOptionalAction, default = True)
+# Resume from the latest local snapshot instead of joining the network again
+parser.add_argument("-r", "--restart", action = argparse.BooleanOptionalAction, default = False)
+# "flask" runs the Flask development server, "async" the aiohttp based
+# server of controllers/async_server.py (requires aiohttp)
+parser.add_argument("-s", "--server", choices = ["flask", "async"], default = "flask")
+# Settings override constants.py: from a YAML/JSON file (or $BLOCKCHAT_CONFIG),
+# BLOCKCHAT_<NAME> environment variables and the options below, in this order.
+# Nodes that join take the network parameters (config.NETWORK_PARAMS) from
+# the bootstrap node, so these only have to be given to the bootstrap node.
+parser.add_argument("-c", "--config", help = "YAML or JSON file mapping constants.py names to values")
+parser.add_argument("--max-nodes", type = int)
+parser.add_argument("--capacity", type = int)
+parser.add_argument("--initial-stake", type = int)
+parser.add_argument("--bootstrap-ip")
+parser.add_argument("--bootstrap-port", type = int)
+parser.add_argument("--set", action = "append", default = [], metavar = "NAME=VALUE", help = "set any constant, e.g. --set MAX_BLOCK_LATENCY=0.5")
 args = parser.parse_args()
 
-if args.okeanos:
-    Constants.BOOTSTRAP_IP_ADDRESS = "192.168.0.1"
-
-app_thread = Thread(target=start_app, args=[app, args])
-app_thread.start()
+overrides = {
+    "MAX_NODES": args.max_nodes,
+    "CAPACITY": args.capacity,
+    "INITIAL_STAKE": args.initial_stake,
+    "BOOTSTRAP_IP_ADDRESS": "192.168.0.1" if args.okeanos else None,
+    "BOOTSTRAP_PORT": args.bootstrap_port,
+}
+if args.bootstrap_ip is not None:
+    overrides["BOOTSTRAP_IP_ADDRESS"] = args.bootstrap_ip
+overrides = {name: value for name, value in overrides.items() if value is not None}
+try:
+    overrides.update(config.parse_assignment(setting) for setting in args.set)
+    config.load(args.config, overrides)
+except ConfigError as e:
+    logging.error(e)
+    sys.exit(-1)
 
 print("-----------------------------------------------------------")
 print("""
@@ -47,17 +91,21 @@ print("""
 """)
 print("-----------------------------------------------------------")
 
-try:
-    controller = BootstrapController(args.file) if args.bootstrap else NodeController(myIP(), args.port, args.file)
-except BootstrapConnError as e:
-    logging.error(e)
+if args.server == "async":
+    from controllers import async_server
+    # Serves on the main thread; the node joins the network from another one
+    async_server.start(lambda loop: create_controller(args, loop), int(port(args)), start_user_interface)
     sys.exit(-1)
 
-print("\nMy pubkey: ...{}...\n".format(controller.node.public_key[100:110]))
+app_thread = Thread(target=start_app, args=[app, args])
+app_thread.start()
+
+controller = create_controller(args)
+if controller is None:
+    sys.exit(-1)
 
 # Add routes / endpoints.
 app.register_blueprint(controller.blueprint, url_prefix='/')
-app.after_request(controller.after_request)
-t = Thread(target=user_interface, args=[controller.node, ""])
+t = Thread(target=start_user_interface, args=[controller])
 t.start()
 
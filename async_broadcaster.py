@@ -0,0 +1,155 @@
+import asyncio
+import logging
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from broadcaster import Broadcaster
+from constants import Constants
+from helper import url_str
+
+
+class AsyncBroadcaster(Broadcaster):
+    """
+    Broadcaster used with the asyncio server (controllers/async_server.py).
+    Requests to peers are sent with a single aiohttp.ClientSession on the
+    server's event loop instead of from a thread per request, and the outbound
+    queues are drained by tasks on that loop. post, broadcast, enqueue and
+    flush keep the blocking interface of Broadcaster for the node's threads;
+    they must not be called from the event loop itself.
+    Plain GETs made through session() (e.g. Node.fetch_blocks) still use requests.
+    """
+
+    def __init__(self, loop, codec=None, post_seconds=None):
+        if aiohttp is None:
+            raise ImportError("The asyncio server requires aiohttp (pip install aiohttp).")
+        super().__init__(codec, post_seconds)
+        self.loop = loop
+        self.client = None
+        # Keeps the sender tasks referenced, so they are not garbage collected
+        self.tasks = set()
+
+    def run(self, coro):
+        """ Runs coro on the event loop and waits for its result """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def client_session(self):
+        # Created lazily, as it has to be created on the event loop
+        if self.client is None:
+            connector = aiohttp.TCPConnector(limit_per_host=Constants.BROADCAST_WORKERS)
+            self.client = aiohttp.ClientSession(connector=connector)
+        return self.client
+
+    async def post_async(self, node_id, node_info, request_body, endpoint):
+        data, headers = self.encode(node_id, request_body, endpoint)
+        url = url_str(node_info.ip_address, node_info.port) + endpoint
+        start = self.loop.time()
+        try:
+            timeout = aiohttp.ClientTimeout(total=Constants.POST_TIMEOUT)
+            async with self.client_session().post(url, data=data, headers=headers, timeout=timeout) as response:
+                await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # repr, as a TimeoutError has no message
+            logging.warning(f"REQ TO {node_id} FAILED: {e!r}")
+            return None
+        if self.post_seconds is not None:
+            self.post_seconds.observe(self.loop.time() - start, peer=node_id, endpoint=endpoint)
+
+        if headers is Constants.COMPACT_HEADER and response.status == 415:
+            logging.info(f"Node {node_id} does not accept the compact format, falling back to JSON.")
+            self.json_only.add(node_id)
+            return await self.post_async(node_id, node_info, request_body, endpoint)
+
+        if not response.ok:
+            logging.warning(f"REQ TO {node_id} FAILED: [{response.status}]: {response.reason}.")
+        return response
+
+    def post(self, node_id, node_info, request_body, endpoint):
+        return self.run(self.post_async(node_id, node_info, request_body, endpoint))
+
+    def broadcast(self, peers: dict, request_body, endpoint):
+        peer_ids = list(peers.keys())
+
+        async def post_all():
+            return await asyncio.gather(*(
+                self.post_async(node_id, peers[node_id], request_body, endpoint) for node_id in peer_ids
+            ))
+
+        return dict(zip(peer_ids, self.run(post_all())))
+
+    def outbound_queue(self, node_id, node_info):
+        """ Returns the outbound queue of a peer, starting its sender task if needed. Runs on the loop. """
+        q = self.queues.get(node_id)
+        if q is None:
+            q = asyncio.Queue(maxsize=Constants.OUTBOUND_QUEUE_SIZE)
+            self.queues[node_id] = q
+            task = self.loop.create_task(self.send_loop(node_id, node_info, q))
+            self.tasks.add(task)
+        return q
+
+    async def send_loop(self, node_id, node_info, q):
+        """ Same as Broadcaster.send_loop, as a task on the event loop """
+        carry = None
+        while True:
+            if carry is not None:
+                request_body, endpoint = carry
+                carry = None
+            else:
+                request_body, endpoint = await q.get()
+
+            if endpoint != "/transactions" or Constants.TX_BATCH_SIZE <= 1:
+                await self.post_async(node_id, node_info, request_body, endpoint)
+                q.task_done()
+                continue
+
+            batch = [request_body]
+            deadline = self.loop.time() + Constants.TX_BATCH_WINDOW
+            while len(batch) < Constants.TX_BATCH_SIZE:
+                if q.empty():
+                    try:
+                        await asyncio.wait_for(self.wait_not_empty(q), max(deadline - self.loop.time(), 0))
+                    except asyncio.TimeoutError:
+                        break
+                next_body, next_endpoint = q.get_nowait()
+                if next_endpoint != "/transactions":
+                    # Send it after the batch, to keep the queue order
+                    carry = (next_body, next_endpoint)
+                    break
+                batch.append(next_body)
+
+            if len(batch) == 1:
+                await self.post_async(node_id, node_info, batch[0], "/transactions")
+            else:
+                await self.post_async(node_id, node_info, batch, "/transactions/batch")
+            for _ in batch:
+                q.task_done()
+
+    async def wait_not_empty(self, q):
+        # Polling instead of awaiting q.get(), which could lose an item when
+        # wait_for times out at the moment it arrives.
+        while q.empty():
+            await asyncio.sleep(Constants.TX_BATCH_WINDOW / 5)
+
+    def enqueue(self, peers: dict, request_body, endpoint):
+        async def put_all():
+            for node_id, node_info in peers.items():
+                q = self.outbound_queue(node_id, node_info)
+                try:
+                    if node_id in self.stalled:
+                        q.put_nowait((request_body, endpoint))
+                    else:
+                        await asyncio.wait_for(q.put((request_body, endpoint)), Constants.ENQUEUE_TIMEOUT)
+                    self.stalled.discard(node_id)
+                except (asyncio.QueueFull, asyncio.TimeoutError):
+                    self.drop(node_id, endpoint)
+
+        self.run(put_all())
+
+    def flush(self):
+        async def join_all():
+            for q in list(self.queues.values()):
+                await q.join()
+
+        self.run(join_all())
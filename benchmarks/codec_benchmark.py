@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Compares the size and parse time of the JSON and compact encodings of a
+block and of a transaction batch.
+Run from the project root: python3 -m benchmarks.codec_benchmark
+"""
+import json
+import time
+from base64 import b64encode
+
+from helper import sha256hash, json_str
+from wallet import Wallet
+from block import Block
+from transaction import Transaction, TransactionBuilder, TransactionType
+from request_classes.block_request import BlockRequest
+from request_classes.compact_codec import CompactCodec
+
+N_NODES = 5
+CAPACITY = 10
+ROUNDS = 2000
+
+
+def make_block():
+    wallets = [Wallet() for _ in range(N_NODES)]
+    keys = [w.public_key for w in wallets]
+    builders = [TransactionBuilder(w) for w in wallets]
+    txs = []
+    for i in range(CAPACITY):
+        sender = i % N_NODES
+        recv = (sender + 1) % N_NODES
+        if i % 2 == 0:
+            txs.append(builders[sender].create(keys[recv], TransactionType.MESSAGE.value, "Lunchtime doubly so."))
+        else:
+            txs.append(builders[sender].create(keys[recv], TransactionType.AMOUNT.value, 13.37))
+    prev_hash = b64encode(sha256hash(b"previous block")).decode()
+    b = Block(1, time.time(), txs, keys[0], prev_hash)
+    b.set_hash()
+    codec = CompactCodec(lambda k: keys.index(k) if k in keys else None, lambda i: keys[i])
+    return b, codec
+
+
+def timed(f, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        f()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+if __name__ == "__main__":
+    b, codec = make_block()
+    json_block = b.to_json().encode()
+    compact_block = codec.encode_block(b)
+    json_batch = json_str(b.transactions).encode()
+    compact_batch = codec.encode_txs(b.transactions)
+
+    assert codec.decode_block(compact_block).to_json() == b.to_json()
+    assert json_str(codec.decode_txs(compact_batch)) == json_str(b.transactions)
+
+    print(f"Block with {CAPACITY} txs, {N_NODES} nodes")
+    print("                 JSON      Compact")
+    print("Block bytes      {:<9d} {:<9d}".format(len(json_block), len(compact_block)))
+    print("Batch bytes      {:<9d} {:<9d}".format(len(json_batch), len(compact_batch)))
+    print("Block parse (us) {:<9.1f} {:<9.1f}".format(
+        timed(lambda: BlockRequest.from_request_to_block(json.loads(json_block))),
+        timed(lambda: codec.decode_block(compact_block))
+    ))
+    print("Batch parse (us) {:<9.1f} {:<9.1f}".format(
+        timed(lambda: [Transaction.from_dict(tx) for tx in json.loads(json_batch)]),
+        timed(lambda: codec.decode_txs(compact_batch))
+    ))
+    print("Block encode (us) {:<9.1f} {:<9.1f}".format(
+        timed(lambda: json.dumps(b.contents(include_hash=True)).encode()),
+        timed(lambda: codec.encode_block(b))
+    ))
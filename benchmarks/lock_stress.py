@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Stress test of the node's locking. A bootstrap node is run in-process with
+fake peers (unreachable addresses, whose keys are held by this script).
+Sender threads submit signed transactions through the controller concurrently,
+the node creates transactions of its own, and a producer thread feeds it the
+blocks of the fake validators while its minting thread mints its own.
+Afterwards the hard state is recomputed from the chain and the soft state
+from the hard state and the mempool, and every accepted transaction must be
+in exactly one of them: any lost update makes the run fail.
+
+Run from the project root: python3 -m benchmarks.lock_stress [--single-lock]
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+from threading import Thread, RLock
+
+from constants import Constants
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--nodes", type=int, default=5)
+parser.add_argument("--txs", type=int, default=300, help="transactions per sender")
+parser.add_argument("--batch", type=int, default=1, help="transactions per request")
+parser.add_argument("--single-lock", action="store_true", help="use one lock for all state, as before")
+args = parser.parse_args()
+
+Constants.MAX_NODES = args.nodes
+Constants.DATA_PATH = tempfile.mkdtemp(prefix="blockchat-stress-")
+logging.basicConfig(level=logging.ERROR)
+
+from block import Block
+from wallet import Wallet
+from controllers.controller import BootstrapController
+from transaction import TransactionBuilder, TransactionType, tx_cost
+
+# Peers that refuse connections right away
+UNREACHABLE_IP = "127.0.0.1"
+UNREACHABLE_PORT = 1
+
+
+def setup():
+    controller = BootstrapController(read_file=False)
+    node = controller.node
+    if args.single_lock:
+        node.lock = node.chain_lock = RLock()
+
+    wallets = {}
+    for i in range(1, args.nodes):
+        wallet = Wallet()
+        response = controller.handle_join({
+            "public_key": wallet.public_key,
+            "ip_address": UNREACHABLE_IP,
+            "port": UNREACHABLE_PORT + i
+        })
+        wallets[response["id"]] = wallet
+    controller.complete_bootstrap()
+    return controller, wallets
+
+
+def send_txs(controller, node_id, wallet, accepted, rejected):
+    builder = TransactionBuilder(wallet)
+    keys = [n.public_key for i, n in controller.node.all_nodes.items() if i != node_id]
+    batch = []
+    for n in range(args.txs):
+        if n % 3 == 0:
+            tx = builder.create(random.choice(keys), TransactionType.MESSAGE.value, "stress")
+        else:
+            tx = builder.create(random.choice(keys), TransactionType.AMOUNT.value, random.randint(1, 3))
+        batch.append(tx)
+        if len(batch) < args.batch:
+            continue
+        if len(batch) == 1:
+            _, status = controller.handle_transaction(batch[0])
+        else:
+            _, status = controller.handle_transaction_batch(batch)
+        if status == 200:
+            accepted.extend(tx.hash for tx in batch)
+        else:
+            rejected.extend(tx.hash for tx in batch)
+        batch = []
+
+
+def create_own_txs(node, n_txs):
+    for n in range(n_txs):
+        node.create_tx(str(1 + n % (args.nodes - 1)), TransactionType.AMOUNT.value, 1)
+
+
+def produce_blocks(controller, wallets, done):
+    """ Mints the blocks of the fake validators """
+    node = controller.node
+    while True:
+        node.lock.acquire()
+        txs = list(node.transactions)[:Constants.CAPACITY]
+        node.lock.release()
+        if len(txs) < Constants.CAPACITY:
+            if done[0]:
+                return
+            time.sleep(0.001)
+            continue
+        validator = node.next_validator()
+        if node.get_node_id_by_public_key(validator) == node.id:
+            # The node's minting thread takes care of it
+            time.sleep(0.001)
+            continue
+        prev = node.blockchain[-1]
+        b = Block(prev.idx + 1, time.time(), txs, validator, prev.block_hash)
+        b.set_hash()
+        controller.accept_blocks([b])
+
+
+def expected_hard_state(node):
+    """ Replays the whole chain on top of the state right after the bootstrap phase """
+    ids = node.all_nodes.keys()
+    stakes = {i: Constants.BOOTSTRAP_INITIAL_STAKE if i == Constants.BOOTSTRAP_ID else Constants.INITIAL_STAKE for i in ids}
+    bcc = {i: -stakes[i] for i in ids}
+    bcc[Constants.BOOTSTRAP_ID] += Constants.STARTING_BCC_PER_NODE * Constants.MAX_NODES
+    nonce = {i: 0 for i in ids}
+    nonce[Constants.BOOTSTRAP_ID] = 1
+    for b in list(node.blockchain)[1:]:
+        for tx in b.transactions:
+            sender = node.get_node_id_by_public_key(tx.sender_addr)
+            assert tx.nonce == nonce[sender], f"nonce gap in the chain for node {sender}"
+            nonce[sender] += 1
+            bcc[sender] -= tx_cost(tx, stakes[sender])
+            if tx.type == TransactionType.STAKE.value:
+                stakes[sender] = tx.amount
+            elif tx.type == TransactionType.AMOUNT.value:
+                bcc[node.get_node_id_by_public_key(tx.recv_addr)] += tx.amount
+        bcc[node.get_node_id_by_public_key(b.validator)] += b.fees()
+    return bcc, stakes, nonce
+
+
+def check(controller, accepted, own_txs):
+    node = controller.node
+    errors = []
+
+    bcc, stakes, nonce = expected_hard_state(node)
+    for name, expected, actual in [("hard_bcc", bcc, node.hard_bcc), ("hard_stakes", stakes, node.hard_stakes), ("hard_nonce", nonce, node.hard_nonce)]:
+        for i in expected:
+            if abs(expected[i] - actual[i]) > 1e-6:
+                errors.append(f"{name}[{i}]: expected {expected[i]}, got {actual[i]}")
+
+    # Soft state is the hard state plus the txs in the mempool
+    soft_bcc, soft_nonce = dict(bcc), dict(nonce)
+    for tx in node.transactions:
+        sender = node.get_node_id_by_public_key(tx.sender_addr)
+        soft_nonce[sender] += 1
+        soft_bcc[sender] -= tx_cost(tx, stakes[sender])
+        if tx.type == TransactionType.AMOUNT.value:
+            soft_bcc[node.get_node_id_by_public_key(tx.recv_addr)] += tx.amount
+    for i, node_info in node.all_nodes.items():
+        if abs(soft_bcc[i] - node_info.bcc) > 1e-6:
+            errors.append(f"soft bcc[{i}]: expected {soft_bcc[i]}, got {node_info.bcc}")
+        if soft_nonce[i] != node.soft_nonce[i]:
+            errors.append(f"soft_nonce[{i}]: expected {soft_nonce[i]}, got {node.soft_nonce[i]}")
+
+    in_chain = [tx.hash for b in node.blockchain for tx in b.transactions]
+    if len(in_chain) != len(set(in_chain)):
+        errors.append("a transaction is in the chain twice")
+    known = set(in_chain) | {tx.hash for tx in node.transactions}
+    lost = [h for h in accepted if h not in known]
+    if lost:
+        errors.append(f"{len(lost)} accepted transactions are neither in the chain nor in the mempool")
+    if node.tx_builder.nonce != 1 + (args.nodes - 1) + own_txs:
+        errors.append(f"the node created {node.tx_builder.nonce} txs, expected {1 + (args.nodes - 1) + own_txs}")
+    # Verified signatures are evicted once their tx is in a block or rejected
+    in_mempool = {(tx.hash, tx.sign) for tx in node.transactions}
+    leaked = [pair for pair in node.verified_txs._verified if pair not in in_mempool]
+    if leaked:
+        errors.append(f"{len(leaked)} verified signatures are kept for txs that are not in the mempool")
+    return errors
+
+
+def main():
+    controller, wallets = setup()
+    node = controller.node
+    # The minting thread starts competing a second after the initial transfers
+    time.sleep(2)
+
+    accepted, rejected = [], []
+    done = [False]
+    own_txs = args.txs // 10
+    senders = [Thread(target=send_txs, args=[controller, i, w, accepted, rejected]) for i, w in wallets.items()]
+    senders.append(Thread(target=create_own_txs, args=[node, own_txs]))
+    producer = Thread(target=produce_blocks, args=[controller, wallets, done])
+
+    start = time.time()
+    producer.start()
+    for t in senders:
+        t.start()
+    for t in senders:
+        t.join()
+    elapsed = time.time() - start
+    done[0] = True
+    producer.join()
+    # Let the minting thread finish its block, if it is the validator
+    while node.next_validator() == node.public_key and len(node.transactions) >= Constants.CAPACITY:
+        time.sleep(0.01)
+    time.sleep(0.5)
+
+    n_txs = len(accepted) + len(rejected) + own_txs
+    print(f"Locking          : {'single lock' if args.single_lock else 'chain_lock + lock'}")
+    print(f"Transactions     : {n_txs} ({len(rejected)} rejected) in {elapsed:.2f} s, {n_txs / elapsed:.0f} tx/s")
+    print(f"Blocks           : {len(node.blockchain)}")
+    print(f"Left in mempool  : {len(node.transactions)}")
+
+    errors = check(controller, accepted, own_txs)
+    for err in errors:
+        print(f"[ERROR] {err}")
+    if not errors:
+        print("[OK] No lost updates.")
+    sys.stdout.flush()
+    # The node's sender threads never return
+    os._exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
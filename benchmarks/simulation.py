@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Runs a whole network in one process and measures it: a BootstrapController
+and MAX_NODES - 1 NodeControllers, each served by its own Flask app on a
+loopback port, join the network as they would with app.py. Once every node
+has its initial BCCs, all nodes send the transactions of their
+input/transX.txt file at once, like app.py --file does. When the chains
+stop growing the script reports:
+- Throughput: transactions in the blocks created after the files started,
+  per second.
+- Block time percentiles.
+- CPU time per phase. This is the CPU time of the threads in each phase,
+  without the phases nested in it, summed over all nodes. "other" is mostly
+  the HTTP servers and JSON.
+
+All nodes share one interpreter (and its GIL), so absolute numbers are lower
+than with one process per node; the harness is meant for comparing changes
+and configurations. Each configuration of the --nodes x --capacity grid
+runs in a fresh subprocess, as nodes have no way to shut down.
+
+Run from the project root:
+python3 -m benchmarks.simulation [--nodes 5 10] [--capacity 1 5 10]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+import subprocess
+from collections import defaultdict
+from threading import Event, Lock, Thread, local
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+import transaction
+from constants import Constants
+from controllers.controller import BootstrapController, NodeController
+from helper import read_transaction_file
+
+LOOPBACK = "127.0.0.1"
+# Seconds the chains must stay the same for the run to be over
+IDLE_TIME = 2
+
+
+class NodeServer:
+    """
+    Serves a node's endpoints on a loopback port. Listens from the start,
+    since a node must be reachable while it joins the network; requests wait
+    until the node's controller is set.
+    """
+
+    def __init__(self, port):
+        self.app = Flask(__name__)
+        self.ready = Event()
+        self.server = make_server(LOOPBACK, port, self, threaded=True)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def __call__(self, environ, start_response):
+        self.ready.wait()
+        return self.app(environ, start_response)
+
+    def set_controller(self, controller):
+        self.app.register_blueprint(controller.blueprint, url_prefix="/")
+        self.ready.set()
+
+
+class PhaseTimer:
+    """
+    Accumulates the CPU time (time.thread_time) spent in wrapped functions
+    per phase. Time spent in a nested phase only counts for the nested one.
+    """
+
+    def __init__(self):
+        self.cpu = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.lock = Lock()
+        self.local = local()
+
+    def reset(self):
+        with self.lock:
+            self.cpu.clear()
+            self.calls.clear()
+
+    def add(self, phase, cpu):
+        with self.lock:
+            self.cpu[phase] += cpu
+
+    def timed(self, phase, fn):
+        def wrapper(*args, **kwargs):
+            stack = self.local.__dict__.setdefault("stack", [])
+            now = time.thread_time()
+            if stack:
+                # Pause the enclosing phase
+                outer = stack[-1]
+                self.add(outer[0], now - outer[1])
+            stack.append([phase, now])
+            with self.lock:
+                self.calls[phase] += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                now = time.thread_time()
+                _, started = stack.pop()
+                self.add(phase, now - started)
+                if stack:
+                    stack[-1][1] = now
+        return wrapper
+
+    def wrap(self, obj, method, phase):
+        setattr(obj, method, self.timed(phase, getattr(obj, method)))
+
+
+def instrument(timer, controller):
+    node = controller.node
+    timer.wrap(node, "create_tx", "create tx")
+    timer.wrap(node, "mint_block", "mint block")
+    timer.wrap(node.broadcaster, "post", "send requests")
+    timer.wrap(controller, "handle_transaction", "receive tx")
+    timer.wrap(controller, "handle_transaction_batch", "receive tx")
+    timer.wrap(controller, "accept_blocks", "receive block")
+    timer.wrap(controller, "process_block", "apply block")
+
+
+def start_network(n_nodes, base_port, timer):
+    """ Starts the bootstrap node and lets the other nodes join, in order """
+    servers = [NodeServer(base_port + i) for i in range(n_nodes)]
+    controllers = [BootstrapController(read_file=False)]
+    instrument(timer, controllers[0])
+    servers[0].set_controller(controllers[0])
+    for i in range(1, n_nodes):
+        controller = NodeController(LOOPBACK, base_port + i, read_file=False)
+        instrument(timer, controller)
+        servers[i].set_controller(controller)
+        controllers.append(controller)
+    return controllers
+
+
+def has_initial_bccs(node):
+    # Same condition as the minting thread's: all initial transfers were received
+    return node.soft_nonce.get(Constants.BOOTSTRAP_ID, 0) >= Constants.MAX_NODES
+
+
+def file_tx_count(node_id, n_nodes):
+    receivers, _ = read_transaction_file(node_id)
+    return sum(1 for receiver in receivers if receiver < n_nodes)
+
+
+def percentile(qs, p):
+    return qs[p - 1] if qs else float("nan")
+
+
+def run(n_nodes, capacity, base_port, timeout):
+    """ Runs one configuration in this process and returns its results as a dict """
+    Constants.MAX_NODES = n_nodes
+    Constants.CAPACITY = capacity
+    Constants.BOOTSTRAP_IP_ADDRESS = LOOPBACK
+    Constants.BOOTSTRAP_PORT = base_port
+    Constants.DATA_PATH = tempfile.mkdtemp(prefix="blockchat-sim-")
+
+    timer = PhaseTimer()
+    # Signatures are also checked on the verification pool's threads
+    transaction.check_hash_and_signature = timer.timed("verify signatures", transaction.check_hash_and_signature)
+
+    controllers = start_network(n_nodes, base_port, timer)
+    nodes = [c.node for c in controllers]
+    while not all(has_initial_bccs(node) for node in nodes):
+        time.sleep(0.1)
+    # The minting threads start a second after the initial transfers
+    time.sleep(1.5)
+
+    timer.reset()
+    cpu_start = time.process_time()
+    t_start = time.time()
+    senders = [Thread(target=node.execute_file_transactions, daemon=True) for node in nodes]
+    for t in senders:
+        t.start()
+
+    # The run is over when all chains have the same length and stay so
+    last_lengths = None
+    last_change = time.time()
+    cpu_end = cpu_start
+    while time.time() - t_start < timeout:
+        time.sleep(0.2)
+        lengths = [len(node.blockchain) for node in nodes]
+        if lengths != last_lengths:
+            last_lengths = lengths
+            last_change = time.time()
+            cpu_end = time.process_time()
+        elif len(set(lengths)) == 1 and time.time() - last_change >= IDLE_TIME \
+                and not any(t.is_alive() for t in senders):
+            break
+
+    blocks = [b for b in list(nodes[0].blockchain)[1:] if b.timestamp >= t_start]
+    n_txs = sum(len(b.transactions) for b in blocks)
+    elapsed = blocks[-1].timestamp - t_start if blocks else float("nan")
+    timestamps = [t_start] + [b.timestamp for b in blocks]
+    block_times = [b - a for a, b in zip(timestamps, timestamps[1:])]
+    qs = statistics.quantiles(block_times, n=100) if len(block_times) >= 2 else []
+
+    cpu = dict(timer.cpu)
+    cpu_total = cpu_end - cpu_start
+    cpu["other"] = max(cpu_total - sum(cpu.values()), 0)
+
+    return {
+        "nodes": n_nodes,
+        "capacity": capacity,
+        "txs": n_txs,
+        "expected_txs": sum(file_tx_count(node.id, n_nodes) for node in nodes),
+        "blocks": len(blocks),
+        "elapsed": elapsed,
+        "throughput": n_txs / elapsed if blocks else 0,
+        "block_time_p50": percentile(qs, 50),
+        "block_time_p90": percentile(qs, 90),
+        "block_time_p99": percentile(qs, 99),
+        "cpu_total": cpu_total,
+        "cpu": cpu,
+        "calls": dict(timer.calls),
+        "chains_identical": len({(len(n.blockchain), n.blockchain[-1].block_hash) for n in nodes}) == 1,
+        "timed_out": time.time() - t_start >= timeout,
+    }
+
+
+def print_report(r):
+    print("################################################################")
+    print("")
+    print(f"MAX NODES = {r['nodes']}")
+    print(f"CAPACITY = {r['capacity']}")
+    print("")
+    print(f"Transactions            : {r['txs']} of {r['expected_txs']} in {r['blocks']} blocks")
+    print(f"Throughput (TX/sec)     : {r['throughput']:.2f}")
+    print("Block time (ms)         : p50 {:.1f}, p90 {:.1f}, p99 {:.1f}".format(
+        r["block_time_p50"] * 1000, r["block_time_p90"] * 1000, r["block_time_p99"] * 1000))
+    print(f"CPU time (sec)          : {r['cpu_total']:.2f}")
+    for phase, cpu in sorted(r["cpu"].items(), key=lambda item: -item[1]):
+        share = 100 * cpu / r["cpu_total"] if r["cpu_total"] else 0
+        calls = r["calls"].get(phase)
+        calls = f"{calls} calls" if calls is not None else ""
+        print(f"    {phase:<20}{cpu:8.2f} {share:5.1f}%  {calls}")
+    if not r["chains_identical"]:
+        print("[ERROR] The chains of the nodes differ.")
+    if r["timed_out"]:
+        print("[ERROR] The run timed out.")
+    print("")
+
+
+def run_grid(args):
+    """ Runs every configuration in its own process and prints a summary """
+    results = []
+    for i, (n_nodes, capacity) in enumerate((n, c) for n in args.nodes for c in args.capacity):
+        cmd = [
+            sys.executable, "-m", "benchmarks.simulation",
+            "--nodes", str(n_nodes), "--capacity", str(capacity),
+            "--port", str(args.port + 100 * i), "--timeout", str(args.timeout), "--json"
+        ]
+        out = subprocess.run(cmd, capture_output=True, text=True).stdout
+        result_lines = [line for line in out.splitlines() if line.startswith("{")]
+        if not result_lines:
+            print(f"[ERROR] The run with {n_nodes} nodes and capacity {capacity} failed.")
+            continue
+        r = json.loads(result_lines[-1])
+        print_report(r)
+        results.append(r)
+
+    print("Nodes  Capacity     TX/sec   Block p50 (ms)   Block p90 (ms)   Block p99 (ms)   CPU (sec)")
+    for r in results:
+        print("{:5}  {:8}  {:9.2f}  {:15.1f}  {:15.1f}  {:15.1f}  {:10.2f}".format(
+            r["nodes"], r["capacity"], r["throughput"],
+            r["block_time_p50"] * 1000, r["block_time_p90"] * 1000, r["block_time_p99"] * 1000,
+            r["cpu_total"]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, nargs="+", default=[5], help="values of MAX_NODES")
+    parser.add_argument("--capacity", type=int, nargs="+", default=[5], help="values of CAPACITY")
+    parser.add_argument("--port", type=int, default=9000, help="port of the bootstrap node; the others follow it")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds after which a run is stopped")
+    parser.add_argument("--json", action="store_true", help="print the results as a line of JSON")
+    args = parser.parse_args()
+
+    if len(args.nodes) > 1 or len(args.capacity) > 1:
+        run_grid(args)
+        return
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    # The nodes print as they go; keep stdout for the report
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    r = run(args.nodes[0], args.capacity[0], args.port, args.timeout)
+    sys.stdout = stdout
+
+    if args.json:
+        print(json.dumps(r))
+    else:
+        print_report(r)
+    sys.stdout.flush()
+    # The nodes' threads never return
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,23 @@
+import json
 import logging
 import time
-from base64 import b64encode
+from base64 import b64encode, b64decode
 import wallet
 from constants import Constants
-from helper import tx_str, hash_dict, sha256hash
+from helper import tx_str, sha256hash, dict_bytes
+from merkle import MerkleTree
 from transaction import TransactionBuilder, verify_tx, TransactionType
 
 class Block():
+    """
+    A block of transactions. The block hash commits to the transactions
+    through the Merkle root of their hashes, so hashing a block only hashes
+    its header and the 32 byte tx hashes. The Merkle tree, the canonical bytes
+    of the header and the JSON of the block are computed once, when first needed.
+    """
+    __slots__ = ("idx", "timestamp", "transactions", "validator", "block_hash", "prev_hash",
+                 "_tree", "_bytes", "_json")
+
     def __init__(self, idx, timestamp, transactions, validator, prev_hash, block_hash=None):
         self.idx = idx
         self.timestamp = timestamp
@@ -14,6 +25,9 @@ class Block():
         self.validator = validator
         self.block_hash = block_hash
         self.prev_hash = prev_hash
+        self._tree = None
+        self._bytes = None
+        self._json = None
 
     def contents(self, include_hash=False):
         if include_hash:
@@ -22,7 +36,7 @@ class Block():
                 "index": self.idx,
                 "timestamp": self.timestamp,
                 "validator": self.validator,
-                "transactions": self.transactions,
+                "transactions": [tx.to_dict() for tx in self.transactions],
                 "hash": self.block_hash
             }
         else:
@@ -31,14 +45,63 @@ class Block():
                 "index": self.idx,
                 "timestamp": self.timestamp,
                 "validator": self.validator,
-                "transactions": self.transactions
+                "transactions": [tx.to_dict() for tx in self.transactions]
             }
 
+    def merkle_tree(self) -> MerkleTree:
+        if self._tree is None:
+            self._tree = MerkleTree([b64decode(tx.hash) for tx in self.transactions])
+        return self._tree
+
+    def merkle_root(self) -> str:
+        return b64encode(self.merkle_tree().root()).decode()
+
+    def header(self):
+        """ The fields covered by the block hash """
+        return {
+            "prev_hash": self.prev_hash,
+            "index": self.idx,
+            "timestamp": self.timestamp,
+            "validator": self.validator,
+            "merkle_root": self.merkle_root()
+        }
+
+    def canonical_bytes(self) -> bytes:
+        """ The bytes that are hashed: the JSON of the header """
+        if self._bytes is None:
+            self._bytes = dict_bytes(self.header())
+        return self._bytes
+
+    def proof(self, tx_hash):
+        """
+        Returns the Merkle inclusion proof of the transaction with the given
+        hash (see merkle.verify_proof), or None if it is not in this block.
+        """
+        for i, tx in enumerate(self.transactions):
+            if tx.hash == tx_hash:
+                return self.merkle_tree().proof(i)
+        return None
+
+    def to_json(self) -> str:
+        """ JSON of the contents including the hash, as sent to other nodes """
+        if self._json is None:
+            # Same output as json.dumps(self.contents()) without its closing
+            # brace, but reusing each transaction's cached JSON.
+            self._json = '{{"prev_hash": {}, "index": {}, "timestamp": {}, "validator": {}, "transactions": [{}]'.format(
+                json.dumps(self.prev_hash),
+                json.dumps(self.idx),
+                json.dumps(self.timestamp),
+                json.dumps(self.validator),
+                ", ".join(tx.to_json() for tx in self.transactions)
+            )
+        return self._json + ', "hash": {}}}'.format(json.dumps(self.block_hash))
+
     def to_str(self, summarized=True, spaces=0):
         indent = spaces * " "
         s = indent +  f"- index: {self.idx}\n"
         s += indent + f"  prev hash: {self.prev_hash}\n"
         s += indent + f"  hash: {self.block_hash}\n"
+        s += indent + f"  merkle root: {self.merkle_root()}\n"
         s += indent +  f"  timestamp: {self.timestamp}\n"
         if summarized:
             s += indent + f"  validator: ...{self.validator[100:110]}...\n"
@@ -53,7 +116,7 @@ class Block():
 
 
     def hash(self):
-        return hash_dict(self.contents())
+        return sha256hash(self.canonical_bytes())
 
     def set_hash(self):
         self.block_hash = b64encode(self.hash()).decode()
@@ -66,27 +129,23 @@ class Block():
         """
         total_fees = 0
         for tx in self.transactions:
-            tx_contents = tx["contents"]
-
-            if tx_contents["type"] == TransactionType.MESSAGE.value:
-                total_fees += len(tx_contents["message"])
-            elif tx_contents["type"] == TransactionType.AMOUNT.value:
-                total_fees += tx_contents["amount"] * (Constants.TRANSFER_FEE_MULTIPLIER - 1)
+            if tx.type == TransactionType.MESSAGE.value:
+                total_fees += len(tx.message)
+            elif tx.type == TransactionType.AMOUNT.value:
+                total_fees += tx.amount * (Constants.TRANSFER_FEE_MULTIPLIER - 1)
 
         return total_fees
 
     def stakes(self):
         stakes = {}
         for tx in self.transactions:
-            tx_contents = tx["contents"]
-
-            if tx_contents["type"] == TransactionType.STAKE.value:
-                stakes[tx_contents["sender_addr"]] = tx_contents["amount"]
+            if tx.type == TransactionType.STAKE.value:
+                stakes[tx.sender_addr] = tx.amount
 
         return stakes
 
     def validate(self, val_pubkey, prev_hash):
-        my_hash = b64encode(hash_dict(self.contents())).decode()
+        my_hash = b64encode(self.hash()).decode()
 
         if not my_hash == self.block_hash:
             logging.warning("Block hash mismatch")
@@ -0,0 +1,143 @@
+import os
+import json
+import struct
+import logging
+from base64 import b64decode, b64encode
+from threading import Lock
+
+from constants import Constants
+from request_classes.block_request import BlockRequest
+
+# Length prefix of a block record in a segment file
+RECORD_HEADER = struct.Struct("!I")
+# Index entry of a block: segment number, offset in the segment, record
+# length and the raw block hash. The n-th entry belongs to block n.
+INDEX_ENTRY = struct.Struct("!IQI32s")
+
+
+class BlockStore:
+    """
+    Append-only on-disk storage of the blockchain.
+    Blocks are appended as length-prefixed JSON records to segment files
+    (blocks-00000.log, blocks-00001.log, ...), starting a new segment once the
+    current one exceeds Constants.SEGMENT_SIZE bytes. The file "index" holds
+    one fixed-size entry per block, so blocks can be found by index or hash.
+    Constants.FSYNC_POLICY decides when data is flushed to disk:
+    "always" (every block), "segment" (when a segment is full) or "never".
+    """
+
+    def __init__(self, path, truncate=False):
+        self.path = path
+        self.lock = Lock()
+        os.makedirs(path, exist_ok=True)
+        if truncate:
+            for fname in os.listdir(path):
+                if fname == "index" or fname.startswith("blocks-"):
+                    os.remove(os.path.join(path, fname))
+
+        # (segment, offset, length) of each block, and block hash -> index
+        self.entries = []
+        self.idx_by_hash = {}
+        self._load_index()
+
+        self.index_file = open(os.path.join(path, "index"), "ab")
+        last_segment = self.entries[-1][0] if self.entries else 0
+        self._open_segment(last_segment)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, "blocks-{:05d}.log".format(segment))
+
+    def _load_index(self):
+        index_path = os.path.join(self.path, "index")
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, "rb") as f:
+            data = f.read()
+        # Drop a partially written last entry
+        n_entries = len(data) // INDEX_ENTRY.size
+        entries = [INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size) for i in range(n_entries)]
+        # Drop the last entries whose records did not reach the disk: unless
+        # every block is synced, the index can be persisted ahead of a segment
+        sizes = {}
+        while entries:
+            segment, offset, length, _ = entries[-1]
+            if segment not in sizes:
+                segment_path = self._segment_path(segment)
+                sizes[segment] = os.path.getsize(segment_path) if os.path.exists(segment_path) else 0
+            if offset + length <= sizes[segment]:
+                break
+            entries.pop()
+        if n_entries != len(entries):
+            logging.warning(f"[BLOCK STORE] Dropped {n_entries - len(entries)} index entries of incomplete blocks")
+            n_entries = len(entries)
+        if n_entries * INDEX_ENTRY.size != len(data):
+            with open(index_path, "r+b") as f:
+                f.truncate(n_entries * INDEX_ENTRY.size)
+        for i, (segment, offset, length, raw_hash) in enumerate(entries):
+            self.entries.append((segment, offset, length))
+            self.idx_by_hash[b64encode(raw_hash).decode()] = i
+        logging.info(f"[BLOCK STORE] Loaded index of {n_entries} blocks from {self.path}")
+
+    def _open_segment(self, segment):
+        self.segment = segment
+        segment_path = self._segment_path(segment)
+        # Records written after the last index entry are incomplete appends
+        end = 0
+        for entry_segment, offset, length in reversed(self.entries):
+            if entry_segment == segment:
+                end = offset + length
+                break
+        self.segment_file = open(segment_path, "ab")
+        if self.segment_file.tell() > end:
+            self.segment_file.truncate(end)
+            self.segment_file.seek(end)
+
+    def _fsync(self):
+        for f in (self.segment_file, self.index_file):
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, b):
+        record = bytes(b.to_json(), "ascii")
+        with self.lock:
+            if self.segment_file.tell() >= Constants.SEGMENT_SIZE:
+                if Constants.FSYNC_POLICY == "segment":
+                    self._fsync()
+                self.segment_file.close()
+                self._open_segment(self.segment + 1)
+
+            offset = self.segment_file.tell()
+            self.segment_file.write(RECORD_HEADER.pack(len(record)) + record)
+            length = RECORD_HEADER.size + len(record)
+            self.index_file.write(INDEX_ENTRY.pack(self.segment, offset, length, b64decode(b.block_hash)))
+
+            if Constants.FSYNC_POLICY == "always":
+                self._fsync()
+            else:
+                self.segment_file.flush()
+                self.index_file.flush()
+
+            self.idx_by_hash[b.block_hash] = len(self.entries)
+            self.entries.append((self.segment, offset, length))
+
+    def get(self, idx):
+        """ Reads the block with index idx from disk """
+        segment, offset, length = self.entries[idx]
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset + RECORD_HEADER.size)
+            record = f.read(length - RECORD_HEADER.size)
+        return BlockRequest.from_request_to_block(json.loads(record))
+
+    def get_by_hash(self, block_hash):
+        idx = self.idx_by_hash.get(block_hash)
+        return None if idx is None else self.get(idx)
+
+    def close(self):
+        with self.lock:
+            if Constants.FSYNC_POLICY != "never":
+                self._fsync()
+            self.segment_file.close()
+            self.index_file.close()
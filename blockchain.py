@@ -1,17 +1,56 @@
+from constants import Constants
+
+
 class Blockchain:
+    """
+    The chain of validated blocks. Without a store, all blocks are kept in
+    memory. With a BlockStore every block is written to disk by add and only
+    the most recent Constants.RESIDENT_BLOCKS blocks stay in memory; older
+    ones are read back from the store when accessed.
+    """
 
-    def __init__(self):
-        self.blocks = []
+    def __init__(self, store=None):
+        self.store = store
+        # Block index -> block, for the blocks kept in memory
+        self.resident = {}
+        self.length = len(store) if store is not None else 0
 
     def __len__(self):
-        return len(self.blocks)
+        return self.length
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.length
+        if idx < 0 or idx >= self.length:
+            raise IndexError("block index out of range")
+        b = self.resident.get(idx)
+        if b is None:
+            b = self.store.get(idx)
+        return b
+
+    def __iter__(self):
+        for idx in range(self.length):
+            yield self[idx]
 
     def add(self, b):
-        self.blocks.append(b)
+        if self.store is not None:
+            self.store.append(b)
+        self.resident[self.length] = b
+        self.length += 1
+        if self.store is not None:
+            self.resident.pop(self.length - 1 - Constants.RESIDENT_BLOCKS, None)
+
+    def set_blocks(self, blocks):
+        """ Replaces the chain, e.g. with the one received from the bootstrap node """
+        if self.store is not None and len(self.store) > 0:
+            raise ValueError("Cannot replace a chain that has already been stored.")
+        self.resident = {}
+        self.length = 0
+        for b in blocks:
+            self.add(b)
 
     def to_str(self, summarized=True, spaces=0):
         s = "blockchain:\n"
-        for i, b in enumerate(self.blocks):
+        for i, b in enumerate(self):
             s += b.to_str(summarized, spaces)
         return s
-
@@ -7,23 +7,29 @@ from request_classes.join_request import JoinRequest
 from request_classes.node_list_request import NodeListRequest
 from request_classes.blockchain_request import BlockchainRequest
 from transaction import TransactionType
+from config import network_config
 
 
 class Bootstrap(Node):
-    def __init__(self, read_file=True):
+    def __init__(self, read_file=True, restore=False, loop=None):
         super().__init__(
             Constants.BOOTSTRAP_IP_ADDRESS,
             Constants.BOOTSTRAP_PORT,
             Constants.BOOTSTRAP_ID,
             Constants.BOOTSTRAP_PRIVKEY_PATH,
-            read_file=read_file
+            read_file=read_file,
+            restore=restore,
+            loop=loop
         )
+        # A restarted bootstrap node has restored its node list and chain
+        if restore:
+            return
         self.my_info = NodeInfo(
             Constants.BOOTSTRAP_IP_ADDRESS,
             Constants.BOOTSTRAP_PORT,
             self.public_key
         )
-        self.all_nodes[self.id] = self.my_info
+        self.add_node_info(self.id, self.my_info)
         self.genesis()
 
     def genesis(self):
@@ -53,7 +59,7 @@ class Bootstrap(Node):
 
     def broadcast_node_list(self):
         # Send list to each node
-        node_list_request = NodeListRequest.from_node_info_dict_to_request(self.all_nodes)
+        node_list_request = NodeListRequest.from_node_info_dict_to_request(self.all_nodes, network_config())
         self.broadcast_request(node_list_request, "/nodes")
 
         logging.info("Bootstrap phase complete. All nodes have received the participant list.")
@@ -76,15 +82,17 @@ class Bootstrap(Node):
             # print("Sending initial bcc to {}".format(node_id))
             transfer_amount = Constants.STARTING_BCC_PER_NODE
             print(f"Transfer amount : {transfer_amount}")
+            self.reserve_nonce()
             tx = self.tx_builder.create(recv_addr=node.public_key,
                                         trans_type=TransactionType.AMOUNT.value,
                                         payload=transfer_amount)
-            self.transactions.append(tx)
+            self.transactions.add(tx)
+            self.notify_mint()
             node.bcc += transfer_amount
             self.my_info.bcc -= transfer_amount * Constants.TRANSFER_FEE_MULTIPLIER
             self.soft_nonce[self.id] += 1
             print("Bootstrap bcc: {}".format(self.my_info.bcc))
-            self.broadcast_request(tx, "/transactions")
+            self.enqueue_request(tx, "/transactions")
 
 
 
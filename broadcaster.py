@@ -0,0 +1,172 @@
+import time
+import logging
+import requests
+from queue import Queue, Empty, Full
+from threading import Lock, Thread
+from multiprocessing.pool import ThreadPool
+from requests.adapters import HTTPAdapter
+
+from constants import Constants
+from helper import url_str, json_str
+
+
+class Broadcaster:
+    """
+    Sends requests to the other nodes of the network. Keeps a requests.Session
+    per peer, so that connections are reused between requests. Requests are
+    either posted to all peers in parallel (broadcast), or put on per-peer
+    outbound queues drained by background sender threads (enqueue).
+    """
+
+    def __init__(self, codec=None, post_seconds=None):
+        # Encodes request bodies when Constants.WIRE_FORMAT is "compact"
+        self.codec = codec
+        # Histogram of the round trip time of posts, by peer and endpoint
+        self.post_seconds = post_seconds
+        # Peers that rejected the compact format (415) and get JSON instead
+        self.json_only = set()
+        self.sessions: dict[int, requests.Session] = {}
+        self.sessions_lock = Lock()
+        self.pool = ThreadPool(Constants.BROADCAST_WORKERS)
+        self.queues: dict[int, Queue] = {}
+        self.queues_lock = Lock()
+        # Peers whose queue was full for ENQUEUE_TIMEOUT; requests for them
+        # are dropped without waiting until their queue has room again
+        self.stalled = set()
+
+    def session(self, node_id):
+        with self.sessions_lock:
+            session = self.sessions.get(node_id)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Constants.BROADCAST_WORKERS)
+                session.mount("http://", adapter)
+                self.sessions[node_id] = session
+            return session
+
+    def encode(self, node_id, request_body, endpoint):
+        """
+        Returns the data and headers of a request to a peer: the compact
+        encoding if it is enabled and the peer accepts it, JSON otherwise.
+        """
+        if Constants.WIRE_FORMAT == "compact" and self.codec is not None and node_id not in self.json_only:
+            data = self.codec.encode(endpoint, request_body)
+            if data is not None:
+                return data, Constants.COMPACT_HEADER
+        return json_str(request_body), Constants.JSON_HEADER
+
+    def post(self, node_id, node_info, request_body, endpoint):
+        """
+        Posts request_body to a single peer. Returns the response, or None if
+        the peer could not be reached.
+        """
+        data, headers = self.encode(node_id, request_body, endpoint)
+        url = url_str(node_info.ip_address, node_info.port) + endpoint
+        start = time.perf_counter()
+        try:
+            response = self.session(node_id).post(url, data=data, headers=headers, timeout=Constants.POST_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"REQ TO {node_id} FAILED: {e}")
+            return None
+        if self.post_seconds is not None:
+            self.post_seconds.observe(time.perf_counter() - start, peer=node_id, endpoint=endpoint)
+
+        if headers is Constants.COMPACT_HEADER and response.status_code == 415:
+            logging.info(f"Node {node_id} does not accept the compact format, falling back to JSON.")
+            self.json_only.add(node_id)
+            return self.post(node_id, node_info, request_body, endpoint)
+
+        if not response.ok:
+            logging.warning(f"REQ TO {node_id} FAILED: [{response.status_code}]: {response.reason}.")
+        return response
+
+    def broadcast(self, peers: dict, request_body, endpoint):
+        """
+        Posts request_body to every peer in parallel and waits for all of them.
+        Returns a dict from node id to response (None for unreachable peers).
+        """
+        peer_ids = list(peers.keys())
+        responses = self.pool.starmap(
+            self.post,
+            [(node_id, peers[node_id], request_body, endpoint) for node_id in peer_ids]
+        )
+        return dict(zip(peer_ids, responses))
+
+    def outbound_queue(self, node_id, node_info):
+        """ Returns the outbound queue of a peer, starting its sender thread if needed """
+        with self.queues_lock:
+            q = self.queues.get(node_id)
+            if q is None:
+                q = Queue(maxsize=Constants.OUTBOUND_QUEUE_SIZE)
+                self.queues[node_id] = q
+                Thread(target=self.send_loop, args=[node_id, node_info, q], daemon=True).start()
+            return q
+
+    def send_loop(self, node_id, node_info, q):
+        """
+        Thread function that posts the requests queued for a peer, in order.
+        Consecutive transactions are sent as a single /transactions/batch request.
+        """
+        carry = None
+        while True:
+            if carry is not None:
+                request_body, endpoint = carry
+                carry = None
+            else:
+                request_body, endpoint = q.get()
+
+            if endpoint != "/transactions" or Constants.TX_BATCH_SIZE <= 1:
+                self.post(node_id, node_info, request_body, endpoint)
+                q.task_done()
+                continue
+
+            batch = [request_body]
+            deadline = time.time() + Constants.TX_BATCH_WINDOW
+            while len(batch) < Constants.TX_BATCH_SIZE:
+                try:
+                    next_body, next_endpoint = q.get(timeout=max(deadline - time.time(), 0))
+                except Empty:
+                    break
+                if next_endpoint != "/transactions":
+                    # Send it after the batch, to keep the queue order
+                    carry = (next_body, next_endpoint)
+                    break
+                batch.append(next_body)
+
+            if len(batch) == 1:
+                self.post(node_id, node_info, batch[0], "/transactions")
+            else:
+                self.post(node_id, node_info, batch, "/transactions/batch")
+            for _ in batch:
+                q.task_done()
+
+    def enqueue(self, peers: dict, request_body, endpoint):
+        """
+        Queues request_body for every peer and returns without waiting for the
+        network. A peer receives its requests in the order they were queued.
+        Blocks while a peer's queue is full, so that producers cannot get
+        arbitrarily ahead of the network, but for at most ENQUEUE_TIMEOUT:
+        a peer that stopped answering must not stall its producers.
+        """
+        for node_id, node_info in peers.items():
+            try:
+                self.outbound_queue(node_id, node_info).put(
+                    (request_body, endpoint), block=node_id not in self.stalled, timeout=Constants.ENQUEUE_TIMEOUT
+                )
+                self.stalled.discard(node_id)
+            except Full:
+                self.drop(node_id, endpoint)
+
+    def drop(self, node_id, endpoint):
+        """ Called when a request for a peer is dropped because its queue is full """
+        if node_id not in self.stalled:
+            logging.warning(f"Outbound queue of node {node_id} is full, dropping its requests until it drains.")
+            self.stalled.add(node_id)
+        logging.info(f"REQ TO {node_id} DROPPED: {endpoint}")
+
+    def flush(self):
+        """ Waits until all queued requests have been sent """
+        with self.queues_lock:
+            queues = list(self.queues.values())
+        for q in queues:
+            q.join()
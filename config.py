@@ -0,0 +1,117 @@
+import os
+import logging
+import yaml
+
+from constants import Constants
+from helper import ConfigError
+
+# Constants.<NAME> can be overridden with the environment variable
+# BLOCKCHAT_<NAME>, e.g. BLOCKCHAT_CAPACITY=10
+ENV_PREFIX = "BLOCKCHAT_"
+# Environment variable with the path of a config file
+CONFIG_ENV = ENV_PREFIX + "CONFIG"
+
+# Parameters that must be the same on all nodes. The bootstrap node sends
+# its values to every node that joins, which applies them, so a network is
+# configured by starting its bootstrap node with the parameters.
+NETWORK_PARAMS = [
+    "MAX_NODES",
+    "CAPACITY",
+    "MAX_BLOCK_LATENCY",
+    "STARTING_BCC_PER_NODE",
+    "TRANSFER_FEE_MULTIPLIER",
+    "INITIAL_STAKE",
+    "BOOTSTRAP_INITIAL_STAKE",
+]
+
+# Settings that are only read when constants.py is imported, before any
+# setting is applied, so overriding them would have no effect
+IMPORT_TIME_PARAMS = [
+    "BOOTSTRAP_PUBKEY_PATH",
+]
+
+
+def set_value(name, value, source):
+    """
+    Sets Constants.<name> to value, checking that the name exists and that
+    the value has the type of its default (an int is accepted for a float).
+    """
+    name = name.upper()
+    if not name.isupper() or not hasattr(Constants, name):
+        raise ConfigError(f"Unknown setting {name} (from {source}).")
+    if name in IMPORT_TIME_PARAMS:
+        raise ConfigError(f"{name} (from {source}) cannot be overridden, it is only read when constants.py is imported.")
+    default = getattr(Constants, name)
+    if default is not None and value is not None and not isinstance(value, type(default)) \
+        and not (isinstance(default, float) and isinstance(value, int)):
+        raise ConfigError(f"{name} (from {source}) must be of type {type(default).__name__}, got {value!r}.")
+    if value != default:
+        logging.info(f"[CONFIG] {name} = {value!r} (from {source})")
+    setattr(Constants, name, value)
+
+
+def apply(settings: dict, source):
+    for name, value in settings.items():
+        set_value(name, value, source)
+
+
+def parse_value(text):
+    """ Parses a value given as text (env or command line) as a YAML scalar: 5, 0.5, null, compact """
+    try:
+        return yaml.safe_load(text)
+    except yaml.YAMLError:
+        return text
+
+
+def parse_assignment(text):
+    """ Parses a NAME=VALUE command line setting """
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise ConfigError(f"Expected NAME=VALUE, got {text!r}.")
+    return name.strip(), parse_value(value)
+
+
+def load_file(path):
+    """ Applies the settings of a YAML (or JSON) file mapping names to values """
+    try:
+        with open(path, "r") as f:
+            settings = yaml.safe_load(f)
+    except (OSError, yaml.YAMLError) as e:
+        raise ConfigError(f"Could not read the config file {path}: {e}")
+    if settings is None:
+        return
+    if not isinstance(settings, dict):
+        raise ConfigError(f"The config file {path} must map setting names to values.")
+    apply(settings, path)
+
+
+def load_env(environ=os.environ):
+    for key, text in environ.items():
+        if key.startswith(ENV_PREFIX) and key != CONFIG_ENV:
+            set_value(key[len(ENV_PREFIX):], parse_value(text), key)
+
+
+def load(path=None, overrides=None):
+    """
+    Overrides the defaults of constants.py with, in increasing priority, the
+    config file (path, or $BLOCKCHAT_CONFIG), the BLOCKCHAT_* environment
+    variables and the overrides dict (command line). Raises ConfigError.
+    """
+    path = path or os.environ.get(CONFIG_ENV)
+    if path:
+        load_file(path)
+    load_env()
+    if overrides:
+        apply(overrides, "command line")
+
+
+def network_config():
+    """ The values of NETWORK_PARAMS, as sent by the bootstrap node """
+    return {name: getattr(Constants, name) for name in NETWORK_PARAMS}
+
+
+def apply_network_config(settings):
+    """ Applies the network parameters received from the bootstrap node (None for an older one) """
+    if settings is None:
+        return
+    apply({name: value for name, value in settings.items() if name in NETWORK_PARAMS}, "bootstrap node")
@@ -12,10 +12,82 @@ class Constants:
     BOOTSTRAP_PRIVKEY_PATH = os.path.join(SRC_PATH, "bootstrap_keys", "id_rsa")
     BOOTSTRAP_INITIAL_STAKE = 10
 
+    # Blocks are stored on disk under DATA_PATH/node<port>/blocks
+    DATA_PATH = os.path.join(SRC_PATH, "data")
+    BLOCK_STORE = True
+    # Bytes after which the block store starts a new segment file
+    SEGMENT_SIZE = 16 * 1024 * 1024
+    # When to fsync the block store: "always", "segment" or "never"
+    FSYNC_POLICY = "segment"
+    # How many of the most recent blocks are kept in memory
+    RESIDENT_BLOCKS = 1000
+    # The hard state is written to DATA_PATH/node<port>/snapshots every
+    # SNAPSHOT_INTERVAL blocks. A node started with --restart loads the latest
+    # snapshot and only replays the stored blocks after it.
+    SNAPSHOT_INTERVAL = 100
+    SNAPSHOTS_KEPT = 2
+    # A node saves a bound on the nonces of the txs it creates, this many
+    # nonces ahead, and continues from it after a restart
+    NONCE_RESERVE = 100
+    # GET /blocks streams this many blocks per chunk
+    SYNC_CHUNK_BLOCKS = 100
+    # Seconds to wait for a peer to connect or send more blocks while syncing
+    SYNC_TIMEOUT = 5
+    # When blocks arrive with a gap before them, the missing blocks are
+    # fetched from a peer after GAP_FETCH_DELAY seconds (they may simply be
+    # late), retrying up to GAP_FETCH_RETRIES times with a doubling delay.
+    GAP_FETCH_DELAY = 0.5
+    GAP_FETCH_RETRIES = 4
+    # Out of order blocks kept in memory; the ones furthest ahead are dropped
+    MAX_PENDING_BLOCKS = 1000
+    # Seconds without a new block, while transactions are waiting, after
+    # which a node asks its peers whether it missed the latest blocks
+    STALL_TIMEOUT = 3
+
     MAX_NODES = 5
     JSON_HEADER = {'Content-Type': 'application/json'}
+    COMPACT_CONTENT_TYPE = 'application/x-blockchat'
+    COMPACT_HEADER = {'Content-Type': COMPACT_CONTENT_TYPE}
+    # Encoding of txs and blocks sent to peers: "json" or "compact"
+    # (see request_classes/compact_codec.py)
+    WIRE_FORMAT = "json"
     CAPACITY = 5
+    # Seconds after which the validator mints a block with fewer than CAPACITY
+    # transactions. None only mints full blocks.
+    MAX_BLOCK_LATENCY = None
     STARTING_BCC_PER_NODE = 1000
     TRANSFER_FEE_MULTIPLIER = 1.03
     INITIAL_STAKE = 10
+    # How many validator draws (one per block hash) to keep in memory
+    VALIDATOR_DRAWS_CACHED = 1024
+    # How many parsed public key objects to keep in memory
+    PUBKEY_CACHE_SIZE = 256
+    # How many verified (hash, signature) pairs of transactions to keep in memory
+    VERIFIED_TX_CACHE_SIZE = 50000
+    # Worker threads posting a broadcast to the peers in parallel
+    BROADCAST_WORKERS = 8
+    # Requests waiting to be sent to a peer before producers block. A full
+    # queue is waited on for at most ENQUEUE_TIMEOUT seconds, then the request
+    # is dropped for that peer (it fetches missed blocks, and receives missed
+    # transactions in their blocks) and, until its queue has room again,
+    # further requests for it are dropped without waiting.
+    OUTBOUND_QUEUE_SIZE = 1000
+    ENQUEUE_TIMEOUT = 1
+    # Seconds to wait for a peer to answer a POST
+    POST_TIMEOUT = 10
+    # Queued transactions for a peer are sent together to /transactions/batch,
+    # up to TX_BATCH_SIZE of them, waiting at most TX_BATCH_WINDOW seconds
+    # for more to arrive. A TX_BATCH_SIZE of 1 disables batching.
+    TX_BATCH_SIZE = 50
+    TX_BATCH_WINDOW = 0.005
+    # Worker threads verifying the signatures of a received block in parallel
+    VERIFY_WORKERS = 4
+    # Threads running request handlers with the asyncio server (app.py --server async)
+    ASYNC_HANDLER_WORKERS = 32
+    # Record when each transaction is created, received, minted and applied
+    # (see tracing.py), for the last TRACE_MAX_TXS transactions
+    TX_TRACING = True
+    TRACE_MAX_TXS = 100000
+    # Seconds between two samples of the profiled threads (profile command)
+    PROFILE_SAMPLE_INTERVAL = 0.005
 
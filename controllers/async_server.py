@@ -0,0 +1,203 @@
+import asyncio
+import logging
+from threading import Event, Thread
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+from constants import Constants
+from helper import DecodeError
+from controllers.controller import BootstrapController
+from request_classes.block_request import BlockRequest
+from transaction import Transaction
+
+
+class AsyncServer:
+    """
+    Alternative to the Flask development server, selected with
+    `app.py --server async`. Serves the same endpoints with aiohttp on an
+    asyncio event loop: request bodies are read without blocking the loop and
+    the NodeController handle_* methods, which take the node lock and verify
+    signatures, run on a pool of ASYNC_HANDLER_WORKERS threads.
+    The server starts listening before the controller exists, as a node must
+    be reachable while it joins the network; requests wait until
+    set_controller is called.
+    """
+
+    def __init__(self, port):
+        if web is None:
+            raise ImportError("The asyncio server requires aiohttp (pip install aiohttp).")
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(Constants.ASYNC_HANDLER_WORKERS)
+        self.controller = None
+        self.ready = asyncio.Event()
+        # Set once the server accepts connections
+        self.started = Event()
+
+        self.app = web.Application()
+        self.app.add_routes([
+            web.post("/nodes", self.post_nodes),
+            web.post("/blockchain", self.post_blockchain),
+            web.post("/transactions", self.post_transaction),
+            web.post("/transactions/batch", self.post_transaction_batch),
+            web.post("/blocks", self.post_block),
+            web.get("/blocks", self.get_blocks),
+            web.get(r"/blocks/{idx:\d+}/proof/{tx_hash:.+}", self.get_tx_proof),
+            web.get("/metrics", self.get_metrics),
+        ])
+
+    def run(self):
+        """ Serves requests until stop is called. Blocks the calling thread. """
+        asyncio.set_event_loop(self.loop)
+        runner = web.AppRunner(self.app, access_log=None)
+        self.loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "0.0.0.0", self.port)
+        self.loop.run_until_complete(site.start())
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(runner.cleanup())
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def set_controller(self, controller):
+        """ Starts handling requests with controller. Called from another thread. """
+        self.controller = controller
+        self.loop.call_soon_threadsafe(self.ready.set)
+
+    async def call(self, fn, *args):
+        """ Runs a blocking controller method on the thread pool, profiled while profiling is on """
+        return await self.loop.run_in_executor(self.executor, self.controller.node.profiler.wrap("handlers", fn), *args)
+
+    def call_later(self, fn, *args):
+        """ Runs fn on the thread pool without waiting for it, like Flask's call_on_close """
+        self.loop.run_in_executor(self.executor, fn, *args)
+
+    async def body(self, request, decode_compact, decode_json):
+        await self.ready.wait()
+        data = await request.read()
+        try:
+            return await self.call(self.controller.decode_body, request.content_type, data, decode_compact, decode_json)
+        except DecodeError as e:
+            raise web.HTTPBadRequest(text=e.msg)
+
+    def respond(self, result):
+        """ Converts the (body, status) or dict returned by a handler to a response """
+        body, status = result if isinstance(result, tuple) else (result, 200)
+        if isinstance(body, dict):
+            return web.json_response(body, status=status)
+        return web.Response(text=body, status=status)
+
+    def query_int(self, request, name, default=None):
+        # Same as Flask's request.args.get(name, default, type=int)
+        try:
+            return int(request.query[name])
+        except (KeyError, ValueError):
+            return default
+
+    # Endpoints
+
+    async def post_nodes(self, request):
+        body = await self.body(request, None, lambda body: body)
+        controller = self.controller
+        if isinstance(controller, BootstrapController):
+            result = await self.call(controller.handle_join, body)
+            self.call_later(controller.complete_bootstrap)
+        else:
+            result = await self.call(controller.handle_node_list, body)
+        return self.respond(result)
+
+    async def post_blockchain(self, request):
+        body = await self.body(request, None, lambda body: body)
+        if isinstance(self.controller, BootstrapController):
+            raise web.HTTPNotFound()
+        return self.respond(await self.call(self.controller.handle_blockchain, body))
+
+    async def post_transaction(self, request):
+        await self.ready.wait()
+        tx = await self.body(request, self.controller.node.codec.decode_tx, Transaction.from_dict)
+        result = await self.call(self.controller.handle_transaction, tx)
+        self.call_later(self.controller.count_received_txs, 1)
+        return self.respond(result)
+
+    async def post_transaction_batch(self, request):
+        await self.ready.wait()
+        txs = await self.body(
+            request,
+            self.controller.node.codec.decode_txs,
+            lambda body: [Transaction.from_dict(tx) for tx in body]
+        )
+        result = await self.call(self.controller.handle_transaction_batch, txs)
+        self.call_later(self.controller.count_received_txs, len(txs))
+        return self.respond(result)
+
+    async def post_block(self, request):
+        await self.ready.wait()
+        b = await self.body(request, self.controller.node.codec.decode_block, BlockRequest.from_request_to_block)
+        await self.call(self.controller.accept_blocks, [b])
+        return web.Response(status=200)
+
+    async def get_blocks(self, request):
+        await self.ready.wait()
+        chunks = await self.call(
+            self.controller.block_chunks,
+            self.query_int(request, "from", 0),
+            self.query_int(request, "to")
+        )
+        if chunks is None:
+            return web.Response(text="Bad request: invalid block range.", status=400)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        while True:
+            # Blocks may have to be read from the block store
+            chunk = await self.call(next, chunks, None)
+            if chunk is None:
+                break
+            await response.write(chunk.encode())
+        await response.write_eof()
+        return response
+
+    async def get_tx_proof(self, request):
+        await self.ready.wait()
+        idx = int(request.match_info["idx"])
+        body, status = await self.call(self.controller.tx_proof, idx, request.match_info["tx_hash"])
+        if status != 200:
+            return web.Response(text=body, status=status)
+        return web.Response(text=body, content_type="application/json")
+
+    async def get_metrics(self, request):
+        await self.ready.wait()
+        return web.Response(
+            text=self.controller.node.metrics.render(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+
+def start(create_controller, port, on_ready):
+    """
+    Runs the asyncio server on the calling (main) thread. The controller is
+    created by create_controller(loop) on another thread once the server
+    listens; on_ready(controller) is then called on that thread.
+    Returns when the server is stopped, or if no controller could be created.
+    """
+    server = AsyncServer(port)
+
+    def setup():
+        server.started.wait()
+        controller = create_controller(server.loop)
+        if controller is None:
+            server.stop()
+            return
+        server.set_controller(controller)
+        on_ready(controller)
+
+    Thread(target=setup).start()
+    logging.info(f"Serving with the asyncio server on port {port}")
+    server.run()
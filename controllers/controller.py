@@ -1,8 +1,13 @@
+import json
+import time
+import struct
 import logging
-from threading import Lock
-from flask import Blueprint, request
+import requests
+from base64 import b64encode
+from threading import Lock, Thread
+from flask import Blueprint, Response, request, g, abort
 
-from helper import BootstrapConnError
+from helper import BootstrapConnError, DecodeError
 from node import Node, NodeInfo
 from bootstrap import Bootstrap
 from request_classes.block_request import BlockRequest
@@ -11,63 +16,132 @@ from request_classes.node_list_request import NodeListRequest
 from request_classes.join_request import JoinRequest
 from response_classes.join_response import JoinResponse
 from constants import Constants
-from transaction import TransactionType, verify_tx, tx_cost 
-
-# How many transactions has this node receieved
-recv_tx = 0
+from config import apply_network_config, network_config
+from transaction import Transaction, TransactionType, verify_tx, tx_cost, cache_pubkeys
 
 class NodeController:
+    """
+    Handles the requests that a node receives. The Flask endpoints below only
+    parse the request and call the handle_* methods, which are shared with
+    the asyncio server (controllers/async_server.py).
+    """
     
-    def __init__(self, ip_address, port, read_file=True):
+    def __init__(self, ip_address, port, read_file=True, restore=False, loop=None):
         self.blueprint = Blueprint("bootstrap blueprint", __name__)
         # equivalent to using @self.blueprint.route on add_node
         # (which wouldn't work because of the self prefix)
         self.blueprint.add_url_rule("/nodes", "nodes", self.set_final_node_list, methods=["POST"])
         self.blueprint.add_url_rule("/blockchain", "blockchain", self.set_initial_blockchain, methods=["POST"])
         self.blueprint.add_url_rule("/transactions", "transaction", self.receive_transaction, methods=["POST"])
+        self.blueprint.add_url_rule("/transactions/batch", "transaction_batch", self.receive_transaction_batch, methods=["POST"])
         self.blueprint.add_url_rule("/blocks", "blocks", self.receive_block, methods=["POST"])
-        self.read_file = read_file
+        self.blueprint.add_url_rule("/blocks", "get_blocks", self.get_blocks, methods=["GET"])
+        self.blueprint.add_url_rule("/blocks/<int:idx>/proof/<path:tx_hash>", "tx_proof", self.get_tx_proof, methods=["GET"])
+        self.blueprint.add_url_rule("/metrics", "metrics", self.get_metrics, methods=["GET"])
+        # Registered on the blueprint, so that it is in place as soon as the routes are
+        self.blueprint.after_request(self.after_request)
+        self.blueprint.before_request(self.begin_profile)
+        self.blueprint.teardown_request(self.end_profile)
+        # A restarted node has already executed its transaction file
+        self.read_file = read_file and not restore
+        # Whether a thread is fetching blocks missing before pending_blocks
+        self.fetching_gap = False
+        # How many transactions has this node received
+        self.recv_tx = 0
+        self.recv_lock = Lock()
         try:
-            self.node = Node(ip_address, port, read_file=read_file)
+            self.node = Node(ip_address, port, read_file=read_file, restore=restore, loop=loop)
         except BootstrapConnError as e:
             raise BootstrapConnError(e.msg)
+        if restore:
+            self.catch_up()
+        Thread(target=self.watch_chain, daemon=True).start()
 
     def after_request(self, response):
         request_path = request.path
+        if request_path == '/transactions':
+            tx_count = 1
+        elif request_path == '/transactions/batch':
+            tx_count = g.get("tx_count", 0)
+        else:
+            tx_count = 0
 
         @response.call_on_close
         def process_after_request():
-            global recv_tx
-            if request_path == '/transactions':
-                recv_tx += 1
-                if self.read_file and recv_tx == Constants.MAX_NODES - 1:
-                    print("Received initial BCCs, BROADCASTING FILE TXs")
-                    self.node.execute_file_transactions()
+            self.count_received_txs(tx_count)
         return response
 
+    def begin_profile(self):
+        """ Profiles the handling of the request, while profiling is on (profile command) """
+        g.profile = self.node.profiler.begin("handlers")
+
+    def end_profile(self, exc):
+        self.node.profiler.end(g.pop("profile", None))
+
+    def count_received_txs(self, tx_count):
+        """
+        Called after a response to received transactions has been sent. Once
+        the initial BCCs have arrived, this node starts sending the
+        transactions of its input file.
+        """
+        if tx_count == 0:
+            return
+        self.recv_lock.acquire()
+        self.recv_tx += tx_count
+        # A batch may carry the last initial BCC tx along with others
+        initial_bccs_received = self.recv_tx - tx_count < Constants.MAX_NODES - 1 <= self.recv_tx
+        self.recv_lock.release()
+        if self.read_file and initial_bccs_received:
+            print("Received initial BCCs, BROADCASTING FILE TXs")
+            self.node.execute_file_transactions()
+
+
+    def request_body(self, decode_compact, decode_json):
+        """
+        Returns the body of the current request, decoding it with decode_compact
+        if it was sent in the compact format, or decode_json if it was JSON.
+        Aborts with a 400 if the body is malformed.
+        """
+        try:
+            return self.decode_body(request.content_type, request.get_data(), decode_compact, decode_json)
+        except DecodeError as e:
+            abort(400, e.msg)
+
+    def decode_body(self, content_type, data, decode_compact, decode_json):
+        """
+        Decodes a request body of the given content type. Raises DecodeError
+        if the body is malformed.
+        """
+        if content_type == Constants.COMPACT_CONTENT_TYPE:
+            try:
+                return decode_compact(data)
+            except (struct.error, KeyError, ValueError, UnicodeDecodeError) as e:
+                # Truncated or garbled body, or unknown node id
+                raise DecodeError(f"Bad request: malformed compact body ({e!r}).")
+        try:
+            return decode_json(json.loads(data))
+        except (ValueError, KeyError, TypeError) as e:
+            # Invalid JSON (or UTF-8), or missing or mistyped fields
+            raise DecodeError(f"Bad request: malformed JSON body ({e!r}).")
 
     def process_soft_tx(self, tx, soft=True):
         """
         Read a transaction and change this node's soft state accordingly
         """
-        tx_contents = tx["contents"]
+        sender_id = self.node.get_node_id_by_public_key(tx.sender_addr)
+        sender_info = self.node.all_nodes[sender_id]
 
-        sender_public_key = tx_contents["sender_addr"]
-        sender_info = self.node.get_node_info_by_public_key(sender_public_key)
-        sender_id = self.node.get_node_id_by_public_key(sender_public_key)
+        recv_id = self.node.get_node_id_by_public_key(tx.recv_addr)
+        recv_info = self.node.all_nodes.get(recv_id)
         
-        recv_public_key = tx_contents["recv_addr"]
-        recv_info = self.node.get_node_info_by_public_key(recv_public_key)
-        recv_id = self.node.get_node_id_by_public_key(recv_public_key)
-        
-        transaction_cost = tx_cost(tx_contents, self.node.soft_stakes[sender_id])
+        transaction_cost = tx_cost(tx, self.node.soft_stakes[sender_id])
         if transaction_cost is None:
             err = "Invalid transaction type was detected."
             logging.warning(err)
             return False, err
 
         # Transaction validations
-        if not verify_tx(tx, self.node.soft_nonce[sender_id]):
+        if not verify_tx(tx, self.node.soft_nonce[sender_id], self.node.verified_txs):
             return False, "[SOFT] Invalid signature."
         if transaction_cost > sender_info.bcc:   # Stakes are not contained in bcc attribute.
             return False, "[SOFT] Not enough bcc to carry out transaction."
@@ -81,10 +155,10 @@ class NodeController:
         # BCCs and transaction list updates
         sender_info.bcc -= transaction_cost
 
-        if tx_contents["type"] == TransactionType.STAKE.value:
-            self.node.soft_stakes[sender_id] = tx_contents["amount"]
-        elif tx_contents["type"] == TransactionType.AMOUNT.value:
-            recv_info.bcc += tx_contents["amount"]
+        if tx.type == TransactionType.STAKE.value:
+            self.node.soft_stakes[sender_id] = tx.amount
+        elif tx.type == TransactionType.AMOUNT.value:
+            recv_info.bcc += tx.amount
 
         return True, ""
 
@@ -93,43 +167,31 @@ class NodeController:
         """
         Read a transaction and change this node's hard state accordingly
         """
-        tx_contents = tx["contents"]
-
-        sender_public_key = tx_contents["sender_addr"]
-        sender_id = self.node.get_node_id_by_public_key(sender_public_key)
+        sender_id = self.node.get_node_id_by_public_key(tx.sender_addr)
+        recv_id = self.node.get_node_id_by_public_key(tx.recv_addr)
         
-        recv_public_key = tx_contents["recv_addr"]
-        recv_id = self.node.get_node_id_by_public_key(recv_public_key)
-        
-        transaction_cost = tx_cost(tx_contents, self.node.hard_stakes[sender_id])
+        transaction_cost = tx_cost(tx, self.node.hard_stakes[sender_id])
         if transaction_cost is None:
             err = "Invalid transaction type was detected."
             logging.warning(err)
             return False, err
 
         # Transaction validations
-        if not verify_tx(tx, self.node.hard_nonce[sender_id]):
+        if not verify_tx(tx, self.node.hard_nonce[sender_id], self.node.verified_txs):
             return False, "[HARD] Invalid signature."
         if transaction_cost > self.node.hard_bcc[sender_id]:   # Stakes are not contained in bcc attribute.
             return False, "[HARD] Not enough bcc to carry out transaction."
 
-        # if the validated transactions jump from nonce n-1 to n+1,
-        # invalidate tx with nonce n in this node's soft TXs
-        for i, node_tx in reversed(list(enumerate(self.node.transactions))):
-            if node_tx["contents"]["sender_addr"] != tx["contents"]["sender_addr"]:
-                continue
-            if node_tx["contents"]["nonce"] < tx_contents["nonce"]:
-                del self.node.transactions[i]
-
-        self.node.hard_nonce[sender_id] = tx_contents["nonce"] + 1
+        self.node.hard_nonce[sender_id] = tx.nonce + 1
 
         # BCCs and transaction list updates
         self.node.hard_bcc[sender_id] -= transaction_cost
 
-        if tx_contents["type"] == TransactionType.STAKE.value:
-            self.node.hard_stakes[sender_id] = tx_contents["amount"]
-        elif tx_contents["type"] == TransactionType.AMOUNT.value:
-            self.node.hard_bcc[recv_id] += tx_contents["amount"]
+        if tx.type == TransactionType.STAKE.value:
+            self.node.hard_stakes[sender_id] = tx.amount
+            self.node.validators.set_stakes(self.node.hard_stakes)
+        elif tx.type == TransactionType.AMOUNT.value:
+            self.node.hard_bcc[recv_id] += tx.amount
 
         return True, ""
 
@@ -137,33 +199,93 @@ class NodeController:
         """
         Endpoint hit by a node broadcasting a transaction.
         """
-        self.node.lock.acquire()
-        tx = request.json
-        valid, err = self.process_soft_tx(tx)
-        if not valid:
-            logging.warning(err)
+        tx = self.request_body(self.node.codec.decode_tx, Transaction.from_dict)
+        return self.handle_transaction(tx)
+
+    def handle_transaction(self, tx):
+        with self.node.metrics.tx_receive_seconds.time(endpoint="/transactions"):
+            # Check the signature before taking the lock; accept_tx then finds it
+            # in the verified cache and only checks the nonce and balance.
+            self.node.verify_txs([tx])
+            self.node.lock.acquire()
+            valid, err = self.accept_tx(tx)
             self.node.lock.release()
+        self.node.metrics.txs_received.inc(result="accepted" if valid else "rejected")
+        if not valid:
             return err, 400
 
-        if tx["hash"] not in self.node.pending_tx:
-            self.node.transactions.append(tx)
-        else:
-            self.node.pending_tx.remove(tx["hash"])
+        self.node.notify_mint()
+        return '', 200
 
-        self.node.lock.release()
+    def receive_transaction_batch(self):
+        """
+        Endpoint hit by a node broadcasting a list of transactions at once.
+        Signatures are verified in parallel and the transactions are applied
+        in order in a single lock section.
+        """
+        txs = self.request_body(self.node.codec.decode_txs, lambda body: [Transaction.from_dict(tx) for tx in body])
+        g.tx_count = len(txs)
+        return self.handle_transaction_batch(txs)
+
+    def handle_transaction_batch(self, txs):
+        with self.node.metrics.tx_receive_seconds.time(endpoint="/transactions/batch"):
+            self.node.verify_txs(txs)
+
+            self.node.lock.acquire()
+            errors = []
+            for tx in txs:
+                valid, err = self.accept_tx(tx)
+                if not valid:
+                    errors.append(err)
+            self.node.lock.release()
+        self.node.metrics.txs_received.inc(len(txs) - len(errors), result="accepted")
+        self.node.metrics.txs_received.inc(len(errors), result="rejected")
+
+        self.node.notify_mint()
+        if errors:
+            return "\n".join(errors), 400
         return '', 200
 
+    def accept_tx(self, tx):
+        """
+        Applies a received transaction to the soft state and adds it to the
+        mempool. Must be called with the node lock held.
+        """
+        # A tx that is already in a block was applied with it; its nonce is
+        # behind the soft state by now, so it is not processed again.
+        if tx.hash in self.node.pending_tx:
+            self.node.pending_tx.remove(tx.hash)
+            self.node.verified_txs.evict(tx)
+            self.node.trace("received", [tx.hash])
+            return True, ""
+
+        valid, err = self.process_soft_tx(tx)
+        if not valid:
+            logging.warning(err)
+            self.node.forget_verified([tx])
+            return False, err
+
+        self.node.trace("received", [tx.hash])
+        self.node.transactions.add(tx)
+        return True, ""
+
     def set_final_node_list(self):
         """
         Endpoint hit by the bootstrap node, who sends the final list of nodes to all participating nodes.
         """
+        return self.handle_node_list(request.json)
+
+    def handle_node_list(self, body):
+        self.node.chain_lock.acquire()
         self.node.lock.acquire()
         
         # Received final node list. Soft and hard BCC are initialized to zero.
-        self.node.all_nodes = NodeListRequest.from_request_to_node_info_dict(request.json)
+        apply_network_config(NodeListRequest.config(body))
+        self.node.set_all_nodes(NodeListRequest.from_request_to_node_info_dict(body))
         self.node.hard_bcc = {node_id: 0 for node_id in self.node.all_nodes.keys()}
+        cache_pubkeys(node_info.public_key for node_info in self.node.all_nodes.values())
         self.node.my_info = self.node.all_nodes[self.node.id]
-        logging.info(f"[Bootstrap Phase] Received NodeInfo for {len(request.json)} nodes.")
+        logging.info(f"[Bootstrap Phase] Received NodeInfo for {len(self.node.all_nodes)} nodes.")
 
         # Initialize stakes at predefined value
         self.node.initialize_stakes()
@@ -178,6 +300,7 @@ class NodeController:
                 self.node.hard_nonce[k] = 0
 
         self.node.lock.release()
+        self.node.chain_lock.release()
         # No need for response body. Responding with status 200.
         return '', 200
 
@@ -185,68 +308,134 @@ class NodeController:
         """
         Endpoint hit by the bootstrap node, who sends the blockchain after bootstrap phase is complete.
         """
+        return self.handle_blockchain(request.json)
+
+    def handle_blockchain(self, body):
+        self.node.chain_lock.acquire()
         self.node.lock.acquire()
 
-        self.node.blockchain.blocks = BlockchainRequest.from_request_to_blocks(request.json)
-        init_bcc = self.node.blockchain.blocks[0].transactions[0]["contents"]["amount"]
+        self.node.blockchain.set_blocks(BlockchainRequest.from_request_to_blocks(body))
+        init_bcc = self.node.blockchain[0].transactions[0].amount
         # Initialize soft and hard states of bootstrap's bcc with the amount
         # given to it by the genesis transaction.
         self.node.all_nodes[Constants.BOOTSTRAP_ID].bcc += init_bcc
         self.node.hard_bcc[Constants.BOOTSTRAP_ID] += init_bcc
+        self.node.save_snapshot()
 
         logging.info("[Bootstrap Phase] Blockchain has been updated successfully.")
         self.node.lock.release()
+        self.node.chain_lock.release()
 
         return '', 200
 
     def process_block(self, b):
         """
-        Read a block, make sure it's valid, change soft and hard state accordingly
+        Read a block, make sure it's valid, change soft and hard state accordingly.
+        Called with chain_lock held; the lock is only taken to update the
+        mempool and the soft state, so txs keep being received meanwhile.
+        Returns whether the block was valid and appended.
         """
         idx = b.idx - 1
 
         logging.info(f"[PROCESS BLOCK] idx: {b.idx}")
         
-        if not b.validate(self.node.next_validator(idx), self.node.blockchain.blocks[idx].block_hash):
-            return
+        if not b.validate(self.node.next_validator(idx), self.node.blockchain[idx].block_hash):
+            return False
         
         # Check that the block contains valid TXs
         for tx in b.transactions:
             valid, err = self.process_hard_tx(tx)
             if not valid:
                 logging.warn(err)
-                return
+                return False
 
 
         val_id = self.node.get_node_id_by_public_key(b.validator)
         self.node.hard_bcc[val_id] += b.fees()
-        
-        # If the block contains a tx that this node hasn't received, add its
-        # hash to the pending_tx list.
-        block_tx_hashes = [tx["hash"] for tx in b.transactions]
-        node_tx_hashes = [tx["hash"] for tx in self.node.transactions]
 
-        for tx_hash in [i for i in block_tx_hashes if i not in node_tx_hashes]:
-            self.node.pending_tx.add(tx_hash)
+        self.node.lock.acquire()
+        # Remove txs included in the block from this node's list. If the block
+        # contains a tx that this node hasn't received, add its hash to the
+        # pending_tx list.
+        for tx in b.transactions:
+            if self.node.transactions.remove(tx.hash) is None:
+                self.node.pending_tx.add(tx.hash)
+            else:
+                # The block is final, so the tx will not be verified again.
+                # Pending ones are yet to be received through /transactions.
+                self.node.verified_txs.evict(tx)
 
-        # Remove txs included in the block from this node's list
-        self.node.transactions = [i for i in self.node.transactions if i not in b.transactions]
+        # if the validated transactions jump from nonce n-1 to n+1,
+        # invalidate tx with nonce n in this node's soft TXs
+        stale_txs = []
+        for sender_addr in {tx.sender_addr for tx in b.transactions}:
+            sender_id = self.node.get_node_id_by_public_key(sender_addr)
+            stale_txs += self.node.transactions.prune_stale(sender_addr, self.node.hard_nonce[sender_id])
+        for stale_tx in stale_txs:
+            self.node.verified_txs.evict(stale_tx)
+
+        self.rebuild_soft_state(b, val_id, stale_txs)
+        self.node.lock.release()
 
-        # Reset soft state to current hard state
-        for k in self.node.hard_bcc.keys():
-            self.node.all_nodes[k].bcc = self.node.hard_bcc[k]            
+        self.node.blockchain.add(b)
+        self.node.snapshot_if_due()
+        self.node.metrics.blocks.inc(validator=val_id)
+        self.node.trace("applied", [tx.hash for tx in b.transactions])
+
+        logging.info(f"[PROCESS BLOCK] idx: {b.idx} DONE")
+        return True
+
+    def rebuild_soft_state(self, b, val_id, stale_txs):
+        """
+        Bring the soft state in line with the hard state after applying block b.
+        Soft state is the hard state plus the effect of the received txs, so
+        only the nodes touched by the block (or by the stale txs it caused to be
+        dropped) are reset to their hard state and only the received txs that
+        touch them are re-applied. Txs that are no longer valid are dropped
+        from the list.
+        """
+        affected = {val_id}
+        for tx in b.transactions + stale_txs:
+            affected.add(self.node.get_node_id_by_public_key(tx.sender_addr))
+            if tx.type == TransactionType.AMOUNT.value:
+                affected.add(self.node.get_node_id_by_public_key(tx.recv_addr))
+
+        # An affected sender's tx may be dropped, which takes the amount away
+        # from its receiver too, so the receiver has to be recomputed as well.
+        amount_txs = [
+            (self.node.get_node_id_by_public_key(tx.sender_addr),
+             self.node.get_node_id_by_public_key(tx.recv_addr))
+            for tx in self.node.transactions
+            if tx.type == TransactionType.AMOUNT.value
+        ]
+        grew = True
+        while grew:
+            grew = False
+            for sender_id, recv_id in amount_txs:
+                if sender_id in affected and recv_id not in affected:
+                    affected.add(recv_id)
+                    grew = True
+
+        # Reset soft state of affected nodes to their hard state
+        for k in affected:
+            self.node.all_nodes[k].bcc = self.node.hard_bcc[k]
             self.node.soft_nonce[k] = self.node.hard_nonce[k]
             self.node.soft_stakes[k] = self.node.hard_stakes[k]
 
-        # Re-apply received transactions to soft state
+        # Re-apply received transactions to the affected part of the soft state.
+        # Signatures are served from the verified tx cache.
         for tx in self.node.transactions:
-            valid, err = self.process_soft_tx(tx)
-            if not valid:
-                logging.warn(err)
-
-        self.node.blockchain.add(b)
-
-        logging.info(f"[PROCESS BLOCK] idx: {b.idx} DONE")
+            sender_id = self.node.get_node_id_by_public_key(tx.sender_addr)
+            if sender_id in affected:
+                valid, err = self.process_soft_tx(tx)
+                if not valid:
+                    logging.warning(err)
+                    self.node.transactions.remove(tx.hash)
+                    self.node.verified_txs.evict(tx)
+            elif tx.type == TransactionType.AMOUNT.value:
+                recv_id = self.node.get_node_id_by_public_key(tx.recv_addr)
+                if recv_id in affected:
+                    self.node.all_nodes[recv_id].bcc += tx.amount
 
     def receive_block(self):
         """
@@ -254,36 +443,256 @@ class NodeController:
         After checking that the block is valid, adds it to the blockchain
         and calculates the next expected validator.
         """
-        self.node.lock.acquire()
+        b = self.request_body(self.node.codec.decode_block, BlockRequest.from_request_to_block)
+        self.accept_blocks([b])
+        return "", 200
 
-        b = BlockRequest.from_request_to_block(request.json)
-        self.node.pending_blocks[b.idx] = b
-        expected_index = self.node.blockchain.blocks[-1].idx + 1
+    def accept_blocks(self, blocks):
+        """
+        Adds blocks to pending_blocks and processes the ones that extend the
+        chain, in index order. Blocks that this node already has are ignored.
+        """
+        # Verify all signatures of the blocks in parallel before taking the lock,
+        # so that process_block only applies balances and nonces.
+        self.node.verify_txs([tx for b in blocks for tx in b.transactions])
+        # Likewise draw the validators of the blocks that follow them
+        self.node.validators.prepare([b.block_hash for b in blocks])
+
+        self.node.chain_lock.acquire()
+        expected_index = self.node.blockchain[-1].idx + 1
+        # Blocks that will not be applied, whose txs are evicted from the verified cache
+        dropped = []
+        for b in blocks:
+            if b.idx >= expected_index:
+                self.node.pending_blocks[b.idx] = b
+            else:
+                dropped.append(b)
         while self.node.pending_blocks.get(expected_index) is not None:
-            self.process_block(self.node.pending_blocks.pop(expected_index))
+            b = self.node.pending_blocks.pop(expected_index)
+            with self.node.metrics.block_process_seconds.time():
+                if not self.process_block(b):
+                    dropped.append(b)
             expected_index += 1
 
         l = len(self.node.pending_blocks)
 
         if l > 0:
             print(f"[RECV BLOCK] have {l} pending blocks")
+            if l > Constants.MAX_PENDING_BLOCKS:
+                # Keep the blocks closest to the chain; the rest are fetched again later
+                for idx in sorted(self.node.pending_blocks)[Constants.MAX_PENDING_BLOCKS:]:
+                    dropped.append(self.node.pending_blocks.pop(idx))
+            if not self.fetching_gap:
+                self.fetching_gap = True
+                Thread(target=self.fetch_missing_blocks, daemon=True).start()
+
+        if dropped:
+            self.node.lock.acquire()
+            self.node.forget_verified([tx for b in dropped for tx in b.transactions])
+            self.node.lock.release()
+        self.node.chain_lock.release()
+        self.node.notify_mint()
 
-        self.node.lock.release()
-        return "", 200
+    def find_gap(self):
+        """
+        Returns the range [start, end) of blocks missing between the chain and
+        the first pending block, and the id of that block's validator (which
+        must have the missing ones), or None if there is no gap.
+        Called with chain_lock held.
+        """
+        if not self.node.pending_blocks:
+            return None
+        start = self.node.blockchain[-1].idx + 1
+        end = min(self.node.pending_blocks)
+        validator_id = self.node.get_node_id_by_public_key(self.node.pending_blocks[end].validator)
+        return start, end, validator_id
+
+    def fetch_missing_blocks(self):
+        """
+        Thread function started when received blocks can not be appended because
+        earlier ones are missing, e.g. because a POST /blocks was lost. Fetches
+        the missing range from the validator of the first pending block, or
+        from any other peer, retrying with a growing delay.
+        """
+        try:
+            for attempt in range(Constants.GAP_FETCH_RETRIES):
+                time.sleep(Constants.GAP_FETCH_DELAY * 2 ** attempt)
+                with self.node.chain_lock:
+                    gap = self.find_gap()
+                if gap is None:
+                    return
+                start, end, validator_id = gap
+                logging.info(f"[GAP] Fetching missing blocks {start} to {end - 1} (attempt {attempt + 1})")
+                peers = sorted(self.node.peers(), key=lambda node_id: node_id != validator_id)
+                for node_id in peers:
+                    self.sync_blocks(node_id, end)
+                    if len(self.node.blockchain) >= end:
+                        break
+            logging.warning(f"[GAP] Could not fetch the missing blocks after {Constants.GAP_FETCH_RETRIES} attempts.")
+        finally:
+            with self.node.chain_lock:
+                self.fetching_gap = False
+
+    def watch_chain(self):
+        """
+        Thread function that catches the case where the latest blocks were lost
+        and no later block arrived to reveal the gap: when the chain has not
+        grown for STALL_TIMEOUT seconds while transactions are waiting, the
+        blocks after the chain's end are requested from the expected validator
+        of the next block. The wait doubles while it has nothing new.
+        """
+        last_len = len(self.node.blockchain)
+        timeout = Constants.STALL_TIMEOUT
+        while True:
+            time.sleep(timeout)
+            cur_len = len(self.node.blockchain)
+            if cur_len != last_len or len(self.node.transactions) == 0 or self.fetching_gap:
+                last_len = cur_len
+                timeout = Constants.STALL_TIMEOUT
+                continue
+            if len(self.node.all_nodes) < Constants.MAX_NODES or self.node.is_next_validator():
+                continue
+            validator_id = self.node.get_node_id_by_public_key(self.node.next_validator())
+            logging.info(f"[GAP] No new block for {timeout} seconds, asking node {validator_id} for blocks after {cur_len - 1}")
+            if self.sync_blocks(validator_id):
+                timeout = Constants.STALL_TIMEOUT
+            else:
+                timeout = min(timeout * 2, 20 * Constants.STALL_TIMEOUT)
+            last_len = len(self.node.blockchain)
+
+    def get_blocks(self):
+        """
+        Endpoint used by nodes that are catching up. Streams the blocks with
+        indexes from `from` up to, but not including, `to` (by default the end
+        of the chain) as newline-delimited JSON, SYNC_CHUNK_BLOCKS blocks at a
+        time, so that long ranges are never held in memory.
+        """
+        chunks = self.block_chunks(request.args.get("from", 0, type=int), request.args.get("to", None, type=int))
+        if chunks is None:
+            return "Bad request: invalid block range.", 400
+        return Response(chunks, mimetype="application/x-ndjson")
+
+    def block_chunks(self, start, end=None):
+        """
+        Returns a generator over the NDJSON chunks of the blocks start to end-1,
+        or None if the range is invalid.
+        """
+        length = len(self.node.blockchain)
+        end = length if end is None else min(end, length)
+        if start < 0:
+            return None
+
+        def generate():
+            for chunk_start in range(start, end, Constants.SYNC_CHUNK_BLOCKS):
+                chunk_end = min(chunk_start + Constants.SYNC_CHUNK_BLOCKS, end)
+                yield "".join(self.node.blockchain[idx].to_json() + "\n" for idx in range(chunk_start, chunk_end))
+
+        return generate()
+
+    def sync_blocks(self, node_id, end=None):
+        """
+        Pulls the blocks after the end of this node's chain (up to end) from
+        node node_id and applies them, SYNC_CHUNK_BLOCKS at a time. If the
+        stream breaks, the blocks received so far are kept and calling it
+        again resumes from the first missing block.
+        Returns the number of blocks appended, or None if the sync failed.
+        """
+        start = len(self.node.blockchain)
+        chunk = []
+        try:
+            for b in self.node.fetch_blocks(node_id, start, end):
+                chunk.append(b)
+                if len(chunk) == Constants.SYNC_CHUNK_BLOCKS:
+                    blocks, chunk = chunk, []
+                    self.accept_blocks(blocks)
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            # Unreachable node, broken stream or malformed block
+            logging.warning(f"[SYNC] Fetching blocks from node {node_id} failed: {e!r}")
+            if chunk:
+                self.accept_blocks(chunk)
+            return None
+        if chunk:
+            self.accept_blocks(chunk)
+        synced = len(self.node.blockchain) - start
+        logging.info(f"[SYNC] Received {synced} blocks from node {node_id}")
+        return synced
+
+    def catch_up(self):
+        """
+        Called after a restart: fetches the blocks created while this node was
+        down from the first peer that answers, then starts the node's threads.
+        """
+        peers = sorted(self.node.peers().keys(), key=lambda node_id: node_id != Constants.BOOTSTRAP_ID)
+        for node_id in peers:
+            if self.sync_blocks(node_id) is not None:
+                break
+        self.node.start_threads()
+
+    def get_metrics(self):
+        """ Endpoint scraped by Prometheus """
+        return Response(self.node.metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    def get_tx_proof(self, idx, tx_hash):
+        """
+        Endpoint used by light clients to check that a transaction is in the
+        block with index idx without downloading the block. Returns the block
+        header (whose hash is the block hash) and the Merkle inclusion proof of
+        the transaction (see merkle.verify_proof).
+        """
+        body, status = self.tx_proof(idx, tx_hash)
+        if status != 200:
+            return body, status
+        return Response(body, mimetype="application/json")
+
+    def tx_proof(self, idx, tx_hash):
+        """ Returns the JSON body of a tx proof response and the status code """
+        self.node.chain_lock.acquire()
+        b = self.node.blockchain[idx] if idx < len(self.node.blockchain) else None
+        self.node.chain_lock.release()
+
+        if b is None:
+            return "Block not found.", 404
+        proof = b.proof(tx_hash)
+        if proof is None:
+            return "Transaction not found in block.", 404
+
+        # Not returned as a dict: Flask would sort the header's keys, and the
+        # block hash is computed over the header JSON in its original order.
+        body = json.dumps({
+            "header": b.header(),
+            "hash": b.block_hash,
+            "tx_hash": tx_hash,
+            "proof": [{"side": side, "hash": b64encode(h).decode()} for side, h in proof]
+        })
+        return body, 200
 
 class BootstrapController(NodeController):
 
-    def __init__(self, read_file=True):
-        self.node = Bootstrap(read_file=read_file)
+    def __init__(self, read_file=True, restore=False, loop=None):
+        self.node = Bootstrap(read_file=read_file, restore=restore, loop=loop)
         self.blueprint = Blueprint("nodes", __name__)
-        self.nodes_counter = 1
-        self.is_bootstrapping_phase_over = False
+        # After a restart the network is already complete
+        self.nodes_counter = len(self.node.all_nodes) if restore else 1
+        self.is_bootstrapping_phase_over = restore
         # equivalent to using @self.blueprint.route on add_node
         # (which wouldn't work because of the self prefix)
         self.blueprint.add_url_rule("/nodes", "nodes", self.add_node, methods=["POST"])
         self.blueprint.add_url_rule("/transactions", "transactions", self.receive_transaction, methods=["POST"])
+        self.blueprint.add_url_rule("/transactions/batch", "transaction_batch", self.receive_transaction_batch, methods=["POST"])
         self.blueprint.add_url_rule("/blocks", "blocks", self.receive_block, methods=["POST"])
-        self.read_file = read_file
+        self.blueprint.add_url_rule("/blocks", "get_blocks", self.get_blocks, methods=["GET"])
+        self.blueprint.add_url_rule("/blocks/<int:idx>/proof/<path:tx_hash>", "tx_proof", self.get_tx_proof, methods=["GET"])
+        self.blueprint.add_url_rule("/metrics", "metrics", self.get_metrics, methods=["GET"])
+        self.blueprint.after_request(self.after_request)
+        self.blueprint.before_request(self.begin_profile)
+        self.blueprint.teardown_request(self.end_profile)
+        self.read_file = read_file and not restore
+        self.fetching_gap = False
+        self.recv_tx = 0
+        self.recv_lock = Lock()
+        if restore:
+            self.catch_up()
+        Thread(target=self.watch_chain, daemon=True).start()
 
     def after_request(self, response):
         self.node.lock.acquire()
@@ -291,17 +700,28 @@ class BootstrapController(NodeController):
 
         @response.call_on_close
         def process_after_request():
-            if request_path == '/nodes' and self.nodes_counter == Constants.MAX_NODES:
-                self.node.broadcast_node_list()
-                self.node.broadcast_blockchain()
-                self.node.initialize_stakes()
-                self.node.perform_initial_transactions()
-                if self.read_file:
-                    self.node.execute_file_transactions()
+            if request_path == '/nodes':
+                self.complete_bootstrap()
 
         self.node.lock.release()
         return response
 
+    def complete_bootstrap(self):
+        """
+        Called after responding to a join request. Once all nodes have joined,
+        sends them the node list and the blockchain and starts the initial transfers.
+        """
+        if self.nodes_counter != Constants.MAX_NODES or self.is_bootstrapping_phase_over:
+            return
+        self.is_bootstrapping_phase_over = True
+        self.node.broadcast_node_list()
+        self.node.broadcast_blockchain()
+        self.node.initialize_stakes()
+        self.node.save_snapshot()
+        self.node.perform_initial_transactions()
+        if self.read_file:
+            self.node.execute_file_transactions()
+
 
     def add_node(self):
         """
@@ -309,36 +729,43 @@ class BootstrapController(NodeController):
         Adds the node's info (public key, ip, port) to the bootstraps node list and
         returns the node's assigned id.
         """
+        return self.handle_join(request.json)
+
+    def handle_join(self, body):
+        self.node.chain_lock.acquire()
         self.node.lock.acquire()
         # Mapping request body to class
 
-        join_request = JoinRequest.from_json(request.json)
+        join_request = JoinRequest.from_json(body)
         logging.info("Received request to add the following node to the network: {}:{}"
-            .format(request.json["ip_address"], request.json["port"]))
+            .format(body["ip_address"], body["port"]))
 
         # Performing validations
         err = self.validate_join_request(join_request)
         if err:
             print(err)
             self.node.lock.release()
+            self.node.chain_lock.release()
             return(err, 400)
 
         # Adding node
-        self.node.all_nodes[self.nodes_counter] = NodeInfo(
+        self.node.add_node_info(self.nodes_counter, NodeInfo(
             join_request.ip_address,
             join_request.port,
             join_request.public_key
-        )
+        ))
         self.node.hard_bcc[self.nodes_counter] = 0
+        cache_pubkeys([join_request.public_key])
         self.node.soft_nonce[self.nodes_counter] = 0
         self.node.hard_nonce[self.nodes_counter] = 0
         logging.info(f"Node with id {self.nodes_counter} has been added to the network.")
 
         # Creating response
-        response = JoinResponse(self.nodes_counter)
+        response = JoinResponse(self.nodes_counter, network_config())
         self.nodes_counter += 1
 
         self.node.lock.release()
+        self.node.chain_lock.release()
         return response.to_dict()
 
     def validate_join_request(self, join_request: JoinRequest):
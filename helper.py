@@ -23,6 +23,22 @@ class BootstrapConnError(Exception):
         super().__init__(msg)
         self.msg = msg
 
+class RestoreError(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+        self.msg = msg
+
+class ConfigError(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+        self.msg = msg
+
+class DecodeError(Exception):
+    """ A request body that could not be decoded, answered with a 400 """
+    def __init__(self, msg):
+        super().__init__(msg)
+        self.msg = msg
+
 def myIP():
     return gethostbyname(gethostname())
 
@@ -53,27 +69,38 @@ def hash_dict(d: dict) -> bytes:
     d_hash = sha256hash(d_bytes)
     return d_hash
 
+def json_str(body) -> str:
+    """
+    Serializes a request body to JSON. Objects that cache their JSON
+    (transactions, blocks) are not serialized again.
+    """
+    if hasattr(body, "to_json"):
+        return body.to_json()
+    if isinstance(body, list):
+        return "[" + ", ".join(json_str(item) for item in body) + "]"
+    return json.dumps(body)
+
 def tx_str(tx, summarized=True, spaces=0):
     """
-    Pretty prints a transaction tx, represented as a dict, with indent leading tabs.
+    Pretty prints a transaction tx with indent leading tabs.
     If summarized is set, prints the characters at indexes 100 to 110 for strings
     that are expected to be multi-line (signatures, public keys)
     """
     indent = spaces * " "
-    s = indent + "- hash: {}\n".format(tx["hash"])
+    s = indent + "- hash: {}\n".format(tx.hash)
     if summarized:
-        s += indent + "  sign: ...{}...\n".format(tx["sign"][100:110]) 
-        s += indent + "  sender_addr: ...{}...\n".format(tx["contents"]["sender_addr"][100:110])
-        s += indent + "  recv_addr: ...{}...\n".format(tx["contents"]["recv_addr"][100:110])
+        s += indent + "  sign: ...{}...\n".format(tx.sign[100:110]) 
+        s += indent + "  sender_addr: ...{}...\n".format(tx.sender_addr[100:110])
+        s += indent + "  recv_addr: ...{}...\n".format(tx.recv_addr[100:110])
     else:   
-        s += indent + "  sign: {}\n".format(tx["sign"])
-        s += indent + "  sender_addr: {}\n".format(tx["contents"]["sender_addr"])
-        s += indent + "  recv_addr: {}\n".format(tx["contents"]["recv_addr"])
+        s += indent + "  sign: {}\n".format(tx.sign)
+        s += indent + "  sender_addr: {}\n".format(tx.sender_addr)
+        s += indent + "  recv_addr: {}\n".format(tx.recv_addr)
     
-    s += indent + "  type: {}\n".format(tx["contents"]["type"])
-    s += indent + "  amount: {}\n".format(tx["contents"]["amount"])
-    s += indent + "  message: {}\n".format(tx["contents"]["message"])
-    s += indent + "  nonce: {}".format(tx["contents"]["nonce"])
+    s += indent + "  type: {}\n".format(tx.type)
+    s += indent + "  amount: {}\n".format(tx.amount)
+    s += indent + "  message: {}\n".format(tx.message)
+    s += indent + "  nonce: {}".format(tx.nonce)
     return s
 
 def read_transaction_file(node_id):
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Combines the logs/latency<id>.csv files dumped by all nodes into the
+end-to-end latencies of transactions: from their creation at one node to
+their receipt at the others, their inclusion in a block by the validator
+and the application of that block at every node.
+"""
+import os
+import csv
+import glob
+from collections import OrderedDict
+
+from tracing import STAGES, format_report
+
+
+def read_traces(path):
+    """ tx hash -> {stage: timestamp} of one node """
+    traces = {}
+    with open(path, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            traces[row["hash"]] = {stage: float(row[stage]) for stage in STAGES if row[stage]}
+    return traces
+
+
+if __name__ == "__main__":
+    fnames = sorted(glob.glob(os.path.join("logs", "latency*.csv")))
+    nodes = [read_traces(fname) for fname in fnames]
+
+    created = {}
+    minted = {}
+    for traces in nodes:
+        for tx_hash, stamps in traces.items():
+            if "created" in stamps:
+                created[tx_hash] = stamps["created"]
+            if "minted" in stamps:
+                minted[tx_hash] = stamps["minted"]
+
+    intervals = OrderedDict((label, []) for label in [
+        "created -> received", "created -> minted", "minted -> applied",
+        "created -> applied", "created -> applied by all"
+    ])
+    for tx_hash, t_created in created.items():
+        applied = [traces[tx_hash]["applied"] for traces in nodes if "applied" in traces.get(tx_hash, {})]
+        for traces in nodes:
+            stamps = traces.get(tx_hash, {})
+            if "received" in stamps:
+                intervals["created -> received"].append(stamps["received"] - t_created)
+        if tx_hash in minted:
+            intervals["created -> minted"].append(minted[tx_hash] - t_created)
+            intervals["minted -> applied"] += [t - minted[tx_hash] for t in applied if t != minted[tx_hash]]
+        intervals["created -> applied"] += [t - t_created for t in applied]
+        if len(applied) == len(nodes):
+            intervals["created -> applied by all"].append(max(applied) - t_created)
+
+    print(f"Transactions created    : {len(created)}")
+    print(f"Applied by all {len(nodes)} nodes  : {len(intervals['created -> applied by all'])}")
+    print(format_report(intervals), end="")
@@ -0,0 +1,81 @@
+import heapq
+import time
+from collections import OrderedDict
+
+
+class Mempool:
+    """
+    The transactions this node has received that are not yet in a block.
+    Transactions are indexed by hash and kept in arrival order, so that the
+    validator can mint the oldest ones first. Each sender also has a heap of
+    (nonce, hash) pairs, used to drop the transactions made stale by a block.
+    """
+
+    def __init__(self):
+        self._txs = OrderedDict()
+        self._by_sender = {}
+        # Arrival time of each transaction, for the block latency timer
+        self._arrived_at = {}
+
+    def __len__(self):
+        return len(self._txs)
+
+    def __iter__(self):
+        # Iterate over a copy, so that callers can remove while iterating
+        return iter(list(self._txs.values()))
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self._txs
+
+    def get(self, tx_hash):
+        return self._txs.get(tx_hash)
+
+    def add(self, tx):
+        tx_hash = tx.hash
+        if tx_hash in self._txs:
+            return
+        self._txs[tx_hash] = tx
+        self._arrived_at[tx_hash] = time.time()
+        sender_heap = self._by_sender.setdefault(tx.sender_addr, [])
+        heapq.heappush(sender_heap, (tx.nonce, tx_hash))
+
+    def remove(self, tx_hash):
+        """
+        Removes and returns the transaction with the given hash, or None if it
+        is not in the mempool. Its entry in the sender heap is removed lazily.
+        """
+        self._arrived_at.pop(tx_hash, None)
+        return self._txs.pop(tx_hash, None)
+
+    def oldest_age(self):
+        """ Seconds since the oldest transaction arrived, or None if empty """
+        if not self._txs:
+            return None
+        return time.time() - self._arrived_at[next(iter(self._txs))]
+
+    def pop_front(self, n):
+        """ Removes and returns the n oldest transactions """
+        txs = []
+        while self._txs and len(txs) < n:
+            tx_hash, tx = self._txs.popitem(last=False)
+            self._arrived_at.pop(tx_hash, None)
+            txs.append(tx)
+        return txs
+
+    def prune_stale(self, sender_addr, next_nonce):
+        """
+        Removes and returns the transactions of sender_addr whose nonce is
+        lower than next_nonce.
+        """
+        stale = []
+        sender_heap = self._by_sender.get(sender_addr)
+        if sender_heap is None:
+            return stale
+        while sender_heap and (sender_heap[0][0] < next_nonce or sender_heap[0][1] not in self._txs):
+            _, tx_hash = heapq.heappop(sender_heap)
+            tx = self.remove(tx_hash)
+            if tx is not None:
+                stale.append(tx)
+        if not sender_heap:
+            del self._by_sender[sender_addr]
+        return stale
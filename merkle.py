@@ -0,0 +1,53 @@
+from helper import sha256hash
+
+# Prefixes that keep leaf and inner node hashes apart, so that an inner node
+# can not be passed off as a transaction hash.
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+class MerkleTree:
+    """
+    Merkle tree over the (raw, 32 byte) hashes of a block's transactions.
+    All levels are kept, so that the root and any inclusion proof are read
+    off the tree without rehashing. A node without a sibling is promoted to
+    the next level unchanged.
+    """
+
+    def __init__(self, leaves: list[bytes]):
+        level = [sha256hash(LEAF_PREFIX + leaf) for leaf in leaves]
+        self.levels = [level]
+        while len(level) > 1:
+            level = [
+                sha256hash(NODE_PREFIX + level[i] + level[i+1]) if i + 1 < len(level) else level[i]
+                for i in range(0, len(level), 2)
+            ]
+            self.levels.append(level)
+
+    def root(self) -> bytes:
+        top = self.levels[-1]
+        return top[0] if top else sha256hash(b"")
+
+    def proof(self, index) -> list[tuple[str, bytes]]:
+        """
+        Returns the sibling hashes on the path from leaf index to the root, each
+        with the side ("L" or "R") it is on.
+        """
+        proof = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                proof.append(("L" if sibling < index else "R", level[sibling]))
+            index //= 2
+        return proof
+
+
+def verify_proof(leaf: bytes, proof, root: bytes) -> bool:
+    """ Checks that leaf (a raw tx hash) is included in the tree with the given root """
+    h = sha256hash(LEAF_PREFIX + leaf)
+    for side, sibling in proof:
+        if side == "L":
+            h = sha256hash(NODE_PREFIX + sibling + h)
+        else:
+            h = sha256hash(NODE_PREFIX + h + sibling)
+    return h == root
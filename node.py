@@ -1,25 +1,34 @@
+import json
 import logging
 import time
-import random
 import requests
 import sys
 import os
 from functools import reduce
 from random import randint
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition
+from multiprocessing.pool import ThreadPool
 
-from helper import tx_str, url_str, read_transaction_file, BootstrapConnError
+from helper import tx_str, url_str, read_transaction_file, BootstrapConnError, RestoreError
 from block import Block
 from blockchain import Blockchain
+from block_store import BlockStore
+from broadcaster import Broadcaster
+from async_broadcaster import AsyncBroadcaster
+from mempool import Mempool
+from snapshot import Snapshot, clear_snapshots
+from telemetry import NodeMetrics, TimedLock
+from tracing import TxTracer
+from profiler import Profiler
 from constants import Constants
+from config import apply_network_config, network_config
 from request_classes.block_request import BlockRequest
+from request_classes.compact_codec import CompactCodec
 from request_classes.join_request import JoinRequest
 from response_classes.join_response import JoinResponse
 from wallet import Wallet
-from transaction import TransactionBuilder, TransactionType, tx_cost
-
-# How many transactions has this node sent
-my_tx = 0
+from transaction import TransactionBuilder, TransactionType, VerifiedTxCache, tx_cost, verify_tx_batch
+from validator_selector import ValidatorSelector
 
 class NodeInfo:
     def __init__(self, ip_address, port, public_key=None, bcc=0):
@@ -30,16 +39,64 @@ class NodeInfo:
 
 
 class Node:
-    def __init__(self, ip_address, port, node_id=None, path=None, read_file=True):
+    def __init__(self, ip_address, port, node_id=None, path=None, read_file=True, restore=False, loop=None):
+        self.data_path = os.path.join(Constants.DATA_PATH, f"node{port}")
+        self.snapshot_path = os.path.join(self.data_path, "snapshots")
+        self.nonce_path = os.path.join(self.data_path, "nonce")
+        # Nonces below it may be used by the txs this node creates
+        self.reserved_nonce = 0
+        key_path = os.path.join(self.data_path, "id_rsa")
+        snapshot = None
+        if restore:
+            snapshot = Snapshot.latest(self.snapshot_path)
+            if snapshot is None:
+                raise RestoreError(f"No snapshot found in {self.snapshot_path} -- cannot restart.")
+            # The network keeps the parameters it was started with
+            apply_network_config(snapshot.config)
+            # A restarting node keeps the key it was created with
+            if path is None:
+                if not os.path.exists(key_path):
+                    raise RestoreError(f"No private key found at {key_path} -- cannot restart.")
+                path = key_path
+        else:
+            # A node that joins the network starts from an empty chain
+            clear_snapshots(self.snapshot_path)
+            if os.path.exists(self.nonce_path):
+                os.remove(self.nonce_path)
+
         self.wallet = Wallet(path)
+        if path is None:
+            os.makedirs(self.data_path, exist_ok=True)
+            self.wallet.save(key_path)
+        self.codec = CompactCodec(self.get_node_id_by_public_key, lambda node_id: self.all_nodes[node_id].public_key)
+        # Served at GET /metrics
+        self.metrics = NodeMetrics(self)
+        self.tracer = TxTracer(Constants.TRACE_MAX_TXS) if Constants.TX_TRACING else None
+        # Profiles the request handlers and minting while on (profile command)
+        self.profiler = Profiler()
+        # With the asyncio server, requests to peers are sent from its event loop
+        if loop is None:
+            self.broadcaster = Broadcaster(self.codec, self.metrics.post_seconds)
+        else:
+            self.broadcaster = AsyncBroadcaster(loop, self.codec, self.metrics.post_seconds)
         self.tx_builder = TransactionBuilder(self.wallet)
+        # How many transactions has this node sent
+        self.my_tx = 0
         self.public_key = self.wallet.public_key
         self.my_info = None
         self.all_nodes: dict[int, NodeInfo] = {}
+        # Index of all_nodes by public key, kept up to date by
+        # add_node_info / set_all_nodes.
+        self.id_by_key: dict[str, int] = {}
         self.hard_bcc = {}
         # Transactions that this node received in a validated block,
         # but hasn't received from the original sender yet.
         self.pending_tx = set()
+        # Transactions whose signature has already been verified by this node
+        self.verified_txs = VerifiedTxCache(Constants.VERIFIED_TX_CACHE_SIZE)
+        # app.py's main thread exits right after startup, which makes
+        # concurrent.futures executors reject work; use a ThreadPool instead.
+        self.verify_pool = ThreadPool(Constants.VERIFY_WORKERS)
         # Blocks that were received when we were not expecting them
         # (e.g getting block with idx i+2 before the one with idx i+1)
         # Save them and validate them after this node finally receives
@@ -47,23 +104,46 @@ class Node:
         self.pending_blocks = {}
         
         # Only the bootstrap node creates a Node object with known id
-        if node_id is None:
+        if snapshot is not None:
+            self.id = snapshot.node_id
+        elif node_id is None:
             self.join_network(ip_address, port, self.public_key)
         else:
             self.id = node_id
         
-        self.transactions = []
+        self.transactions = Mempool()
         self.soft_stakes = {}
         self.hard_stakes = {}
+        # Draws the validators from hard_stakes; updated whenever they change
+        self.validators = ValidatorSelector()
         self.soft_nonce = {}
         self.hard_nonce = {}
 
-        self.blockchain = Blockchain()
-        self.lock = Lock()
+        store = None
+        if Constants.BLOCK_STORE:
+            # A node that joins the network starts from an empty chain
+            store = BlockStore(os.path.join(self.data_path, "blocks"), truncate=not restore)
+        self.blockchain = Blockchain(store)
+        # lock guards the mempool, the soft state (balances in all_nodes,
+        # soft_stakes, soft_nonce) and pending_tx. chain_lock guards the
+        # blockchain, the hard state and pending_blocks. When both are needed,
+        # chain_lock is taken first.
+        self.lock = TimedLock(self.metrics.lock_wait_seconds, "lock")
+        self.chain_lock = TimedLock(self.metrics.lock_wait_seconds, "chain_lock")
         self.mint_broadcast_lock = Lock()
+        # Signalled when a transaction is received or a block is appended
+        self.mint_cond = Condition()
+        self.read_file = read_file
+        if snapshot is not None:
+            # The controller starts the threads once the node has caught up
+            self.restore(snapshot)
+        else:
+            self.start_threads()
+
+    def start_threads(self):
         thr = Thread(target=self.poll_capacity)
         thr.start()
-        if read_file:
+        if self.read_file:
             thr2 = Thread(target=self.poll_done)
             thr2.start()
  
@@ -77,16 +157,51 @@ class Node:
             or (self.soft_nonce.get(Constants.BOOTSTRAP_ID) < Constants.MAX_NODES):
             time.sleep(1)
         time.sleep(1)
-        blocks_competed_for = 1
+        # Start with the block after the chain, which a restarted node has
+        # only caught up with by now
+        blocks_competed_for = len(self.blockchain)
         while True:
-            # print(f"is_next_validator {self.is_next_validator()}!!")
-            if blocks_competed_for <= len(self.blockchain.blocks) and len(self.transactions) >= Constants.CAPACITY:
-                if self.is_next_validator(blocks_competed_for - 1):
-                    self.mint_block()
-                blocks_competed_for += 1
-            else:
-                # yield
-                time.sleep(0)
+            with self.mint_cond:
+                # Blocks that were appended meanwhile are not competed for
+                blocks_competed_for = max(blocks_competed_for, len(self.blockchain))
+                while not self.should_compete(blocks_competed_for):
+                    self.mint_cond.wait(self.mint_timeout(blocks_competed_for))
+            if self.is_next_validator(blocks_competed_for - 1):
+                with self.profiler.section("minting"):
+                    self.mint_block(blocks_competed_for)
+            blocks_competed_for += 1
+
+    def should_compete(self, blocks_competed_for):
+        """
+        True when the block preceding the one to compete for has been appended
+        and there are enough transactions for a block, or the oldest one has
+        waited for more than MAX_BLOCK_LATENCY.
+        """
+        if blocks_competed_for > len(self.blockchain):
+            return False
+        if len(self.transactions) >= Constants.CAPACITY:
+            return True
+        oldest_age = self.transactions.oldest_age()
+        return Constants.MAX_BLOCK_LATENCY is not None \
+            and oldest_age is not None \
+            and oldest_age >= Constants.MAX_BLOCK_LATENCY
+
+    def mint_timeout(self, blocks_competed_for):
+        """
+        How long the minting thread may sleep before checking the latency timer.
+        While waiting for the previous block it sleeps until notified.
+        """
+        if Constants.MAX_BLOCK_LATENCY is None or blocks_competed_for > len(self.blockchain):
+            return None
+        oldest_age = self.transactions.oldest_age()
+        if oldest_age is None:
+            return Constants.MAX_BLOCK_LATENCY
+        return max(Constants.MAX_BLOCK_LATENCY - oldest_age, 0.001)
+
+    def notify_mint(self):
+        """ Wakes up the minting thread """
+        with self.mint_cond:
+            self.mint_cond.notify()
 
     def poll_done(self):
         """
@@ -109,6 +224,110 @@ class Node:
                 last_len = cur_len
                 time.sleep(3)
 
+    def restore(self, snapshot):
+        """
+        Restores the state of a restarting node from a snapshot and the block
+        store: the hard state at the snapshot's height is loaded and only the
+        stored blocks after it are replayed. The soft state starts out equal
+        to the hard state, as the received txs were lost with the process.
+        """
+        if len(self.blockchain) <= snapshot.height \
+            or self.blockchain[snapshot.height].block_hash != snapshot.block_hash:
+            raise RestoreError(f"Snapshot of height {snapshot.height} does not match the stored blockchain.")
+
+        self.set_all_nodes({
+            n["id"]: NodeInfo(n["ip_address"], n["port"], n["public_key"]) for n in snapshot.nodes
+        })
+        self.my_info = self.all_nodes[self.id]
+        self.hard_bcc = snapshot.hard_bcc
+        self.hard_stakes = snapshot.hard_stakes
+        self.validators.set_stakes(self.hard_stakes)
+        self.hard_nonce = snapshot.hard_nonce
+
+        for idx in range(snapshot.height + 1, len(self.blockchain)):
+            self.apply_block(self.blockchain[idx])
+        logging.info(f"[RESTORE] Replayed {len(self.blockchain) - snapshot.height - 1} blocks after snapshot {snapshot.height}")
+
+        for node_id, node_info in self.all_nodes.items():
+            node_info.bcc = self.hard_bcc[node_id]
+        self.soft_stakes = dict(self.hard_stakes)
+        self.soft_nonce = dict(self.hard_nonce)
+        # Peers may still hold txs this node created after its last block,
+        # so continue after the nonces it had reserved for them
+        self.tx_builder.nonce = max(self.hard_nonce[self.id], self.load_reserved_nonce())
+        self.reserved_nonce = self.tx_builder.nonce
+
+    def reserve_nonce(self):
+        """
+        Called before a tx is created: makes sure that its nonce is below the
+        nonce saved in the data dir, saving one NONCE_RESERVE ahead if not.
+        A restarted node continues from the saved nonce, as its peers may hold
+        txs it created before going down; the nonces it skips are harmless,
+        only lower nonces than expected are rejected.
+        """
+        if self.tx_builder.nonce < self.reserved_nonce:
+            return
+        self.reserved_nonce = self.tx_builder.nonce + Constants.NONCE_RESERVE
+        os.makedirs(self.data_path, exist_ok=True)
+        tmp_path = self.nonce_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(self.reserved_nonce))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.nonce_path)
+
+    def load_reserved_nonce(self):
+        """ The nonce saved by reserve_nonce, or 0 """
+        try:
+            with open(self.nonce_path, "r") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def save_snapshot(self):
+        """ Writes the hard state at the last block to disk. Called with chain_lock held. """
+        snapshot = Snapshot(
+            len(self.blockchain) - 1,
+            self.blockchain[-1].block_hash,
+            self.id,
+            [
+                {"id": node_id, "ip_address": n.ip_address, "port": n.port, "public_key": n.public_key}
+                for node_id, n in self.all_nodes.items()
+            ],
+            self.hard_bcc,
+            self.hard_stakes,
+            self.hard_nonce,
+            network_config(),
+        )
+        snapshot.save(self.snapshot_path, Constants.SNAPSHOTS_KEPT)
+        logging.info(f"[SNAPSHOT] Saved snapshot of height {snapshot.height}")
+
+    def snapshot_if_due(self):
+        """ Saves a snapshot every SNAPSHOT_INTERVAL blocks. Called with chain_lock held. """
+        if Constants.SNAPSHOT_INTERVAL and (len(self.blockchain) - 1) % Constants.SNAPSHOT_INTERVAL == 0:
+            self.save_snapshot()
+
+    def apply_block(self, b):
+        """
+        Applies an already validated block to the hard state, without checking
+        its transactions again. Used for the blocks this node mints and for
+        replaying stored blocks on restart.
+        """
+        for tx in b.transactions:
+            sender_id = self.get_node_id_by_public_key(tx.sender_addr)
+            self.hard_bcc[sender_id] -= tx_cost(tx, self.hard_stakes[sender_id])
+            self.hard_nonce[sender_id] = tx.nonce + 1
+
+            if tx.type == TransactionType.STAKE.value:
+                self.hard_stakes[sender_id] = tx.amount
+                self.validators.set_stakes(self.hard_stakes)
+            if tx.type == TransactionType.AMOUNT.value:
+                recv_id = self.get_node_id_by_public_key(tx.recv_addr)
+                self.hard_bcc[recv_id] += tx.amount
+
+        val_id = self.get_node_id_by_public_key(b.validator)
+        self.hard_bcc[val_id] += b.fees()
+
     def initialize_stakes(self):
         for node_id, node_info in self.all_nodes.items():
             initial_stake = Constants.BOOTSTRAP_INITIAL_STAKE if node_id == Constants.BOOTSTRAP_ID else Constants.INITIAL_STAKE
@@ -116,17 +335,50 @@ class Node:
             self.hard_stakes[node_id] = initial_stake
             self.all_nodes[node_id].bcc -= initial_stake
             self.hard_bcc[node_id] -= initial_stake
+        self.validators.set_stakes(self.hard_stakes)
         return self.soft_stakes
 
+    def add_node_info(self, node_id, node_info):
+        """
+        Adds a node to all_nodes and indexes it by its public key.
+        """
+        self.all_nodes[node_id] = node_info
+        self.id_by_key[node_info.public_key] = node_id
+
+    def set_all_nodes(self, all_nodes: dict[int, NodeInfo]):
+        """
+        Replaces the node list and rebuilds the public key index.
+        """
+        self.all_nodes = {}
+        self.id_by_key = {}
+        for node_id, node_info in all_nodes.items():
+            self.add_node_info(node_id, node_info)
+
     def get_node_info_by_public_key(self, public_key):
-        for node_info in self.all_nodes.values():
-            if node_info.public_key == public_key:
-                return node_info
+        node_id = self.id_by_key.get(public_key)
+        if node_id is not None:
+            return self.all_nodes[node_id]
 
     def get_node_id_by_public_key(self, public_key):
-        for node_id, node_info in self.all_nodes.items():
-            if node_info.public_key == public_key:
-                return node_id
+        return self.id_by_key.get(public_key)
+
+    def verify_txs(self, txs):
+        """
+        Verifies the signatures of txs in parallel, without holding the lock.
+        Nonces and balances are checked later, when the txs are applied.
+        """
+        with self.metrics.tx_verify_seconds.time():
+            return verify_tx_batch(txs, self.verify_pool, self.verified_txs)
+
+    def forget_verified(self, txs):
+        """
+        Evicts txs that were not applied from the verified cache, except the
+        ones waiting in the mempool. Called with the lock held.
+        """
+        for tx in txs:
+            pooled = self.transactions.get(tx.hash)
+            if pooled is None or pooled.sign != tx.sign:
+                self.verified_txs.evict(tx)
 
     def join_network(self, ip, port, pubkey):
         """
@@ -150,45 +402,66 @@ class Node:
         if join_response.ok:
             response = JoinResponse.from_json(join_response.json())
             self.id = response.id
+            apply_network_config(response.config)
             print(f"Joined the network successfully with id {self.id}. Waiting for bootstrap phase completion.")
         else:
             raise BootstrapConnError(join_response.text)
 
+    def fetch_blocks(self, node_id, start, end=None):
+        """
+        Generator over the blocks with indexes start to end-1 (or to the end of
+        the chain if end is None), streamed from GET /blocks of node node_id.
+        Blocks are parsed one at a time as they arrive, so memory use does not
+        grow with the range. Raises requests.exceptions.RequestException if the
+        node cannot be reached or the stream breaks, and ValueError or KeyError
+        if a block is malformed.
+        """
+        node_info = self.all_nodes[node_id]
+        params = {"from": start}
+        if end is not None:
+            params["to"] = end
+
+        response = self.broadcaster.session(node_id).get(
+            url_str(node_info.ip_address, node_info.port) + "/blocks",
+            params=params,
+            stream=True,
+            timeout=Constants.SYNC_TIMEOUT,
+        )
+        with response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield BlockRequest.from_request_to_block(json.loads(line))
+
     def broadcast_request(self, request_body, endpoint):
-        for node_id, node in self.all_nodes.items():
-            # Do not send a request to myself!
-            if node_id == self.id:
-                continue
+        """
+        Posts request_body to endpoint on all other nodes, in parallel.
+        Returns a dict from node id to response (None if unreachable).
+        """
+        # Do not send a request to myself!
+        return self.broadcaster.broadcast(self.peers(), request_body, endpoint)
 
-            response = requests.post(url_str(node.ip_address, node.port) + endpoint,
-                                     json=request_body,
-                                     headers=Constants.JSON_HEADER)
+    def enqueue_request(self, request_body, endpoint):
+        """
+        Queues request_body to be posted to endpoint on all other nodes by the
+        background sender threads, preserving the order of queued requests.
+        """
+        self.broadcaster.enqueue(self.peers(), request_body, endpoint)
 
-            if not response.ok:
-                logging.warning(f"REQ TO {node_id} FAILED: [{response.status_code}]: {response.reason}.")
+    def peers(self):
+        # Do not send a request to myself!
+        return {node_id: node for node_id, node in self.all_nodes.items() if node_id != self.id}
 
     def is_next_validator(self, idx=-1):
         return self.next_validator(idx) == self.public_key
 
     def next_validator(self, idx=-1):
         """
-        Function that runs the Proof of Stake algorithm and returns the next
-        validator's public key
+        Function that runs the Proof of Stake algorithm and returns the public
+        key of the validator of the block after the one with index idx
         """
-        prev_block = self.blockchain.blocks[idx]
-
-        nodes = [i for i in range(Constants.MAX_NODES)]
-        stakes = [self.hard_stakes[i] for i in nodes]
-
-        total_stake = sum(stakes)
-
-        weights = [stakes[i]/total_stake for i in nodes]
-
-        random.seed(prev_block.block_hash)
-        i = random.choices(nodes, weights=weights, k=1)[0]
-        
-        return self.all_nodes[i].public_key
-
+        prev_block = self.blockchain[idx]
+        return self.all_nodes[self.validators.select(prev_block.block_hash)].public_key
 
     def create_tx(self, recv, type, payload):
         """
@@ -197,8 +470,6 @@ class Node:
         message transactions: payload is the message string
         amoutn transactions: payload is the amount to be sent
         """
-        global my_tx
-
         # Accept IDs instead of public keys as well.
         if recv.isdigit():
             if self.all_nodes.get(int(recv)) is None:
@@ -224,9 +495,9 @@ class Node:
 
         self.lock.acquire()
         self.mint_broadcast_lock.acquire()
-        my_tx += 1
+        self.my_tx += 1
         logging.info("[CREATE TX {}] Cost: {} My balance: {} My val balance: {}".format(
-            my_tx,
+            self.my_tx,
             transaction_cost,
             self.my_info.bcc,
             self.hard_bcc[self.id]
@@ -247,64 +518,77 @@ class Node:
         elif type == TransactionType.STAKE.value:
             self.soft_stakes[self.id] = payload
 
+        self.reserve_nonce()
         tx_request = self.tx_builder.create(recv, type, payload)
 
-        logging.info("[CREATE TX {}] Hash: {}".format(my_tx, tx_request["hash"]))
+        logging.info("[CREATE TX {}] Hash: {}".format(self.my_tx, tx_request.hash))
+        self.trace("created", [tx_request.hash])
 
-        self.transactions.append(tx_request)
+        self.transactions.add(tx_request)
 
         self.lock.release()
+        # Queue while still holding mint_broadcast_lock, so that txs are
+        # queued in nonce order and not interleaved with a block broadcast.
+        self.enqueue_request(tx_request, "/transactions")
         self.mint_broadcast_lock.release()
-        self.broadcast_request(tx_request, "/transactions")
+        self.notify_mint()
 
-    def mint_block(self):
+    def mint_block(self, idx):
         """
         Method called by the validator node.
-        Remove the oldest `capacity` received transactions, create a block from
-        them and send it to the rest of the nodes.
+        Remove the oldest `capacity` received transactions, create block idx
+        from them and send it to the rest of the nodes. Does nothing if block
+        idx is no longer the next one, as this node was only found to be the
+        validator of block idx.
         """
+        self.chain_lock.acquire()
+        prev_block = self.blockchain[-1]
+        if prev_block.idx + 1 != idx:
+            self.chain_lock.release()
+            logging.warning(f"[MINT BLOCK] idx: {idx} skipped, the chain is at {prev_block.idx}")
+            return
+        # Remove the txs added to the block from this node's list
         self.lock.acquire()
-        prev_block = self.blockchain.blocks[-1]
-        block_txs = self.transactions[:Constants.CAPACITY]
-
-        # Prune txs added to the block from this node's list
-        self.transactions = self.transactions[Constants.CAPACITY:]
+        block_txs = self.transactions.pop_front(Constants.CAPACITY)
+        self.lock.release()
 
         b = Block(prev_block.idx+1, time.time(), block_txs, self.public_key, prev_block.block_hash)
         b.set_hash()
+        self.trace("minted", [tx.hash for tx in block_txs])
 
         logging.info(f"[MINT BLOCK] idx: {prev_block.idx+1}")
 
         # Update the amount of validated BCCs for each node.
-        for tx in block_txs:
-            sender_id = self.get_node_id_by_public_key(tx["contents"]["sender_addr"])
-            self.hard_bcc[sender_id] -= tx_cost(tx["contents"], self.hard_stakes[sender_id])
-
-            if tx["contents"]["type"] == TransactionType.STAKE.value:
-                self.hard_stakes[sender_id] = tx["contents"]["amount"]
-            if tx["contents"]["type"] == TransactionType.AMOUNT.value:
-                recv_pubkey = tx["contents"]["recv_addr"]
-                recv_id = self.get_node_id_by_public_key(recv_pubkey)
-                self.hard_bcc[recv_id] += tx["contents"]["amount"]
-
+        self.apply_block(b)
+        self.lock.acquire()
         self.my_info.bcc += b.fees()
-        self.hard_bcc[self.id] += b.fees()
+        self.lock.release()
 
-        block_request = BlockRequest.from_block_to_request(b)
         self.blockchain.add(b)
+        self.snapshot_if_due()
+        self.metrics.blocks.inc(validator=self.id)
+        self.trace("applied", [tx.hash for tx in block_txs])
+        # The block is final, so its txs will not be verified again
+        for tx in block_txs:
+            self.verified_txs.evict(tx)
 
-        self.lock.release()
+        self.chain_lock.release()
 
         self.mint_broadcast_lock.acquire()
-        self.broadcast_request(block_request, '/blocks')
+        self.enqueue_request(b, '/blocks')
         self.mint_broadcast_lock.release()
 
+    def trace(self, stage, tx_hashes):
+        """ Records that the given txs reached a stage (see tracing.STAGES) """
+        if self.tracer is not None:
+            self.tracer.record(stage, tx_hashes)
+
     def stake(self, amount):
         self.create_tx("0", TransactionType.STAKE.value, amount)
         print(f"Node {self.id} stakes {amount}")
 
     def view_block(self):
-        return self.blockchain.blocks[-1].to_str()
+        return self.blockchain[-1].to_str()
 
     def read_simple_transaction_file(self):
         """
@@ -330,7 +614,12 @@ class Node:
         Read input/transX.txt, where X is this node's id
         and execute its transactions
         """
-        receivers, messages = read_transaction_file(self.id)
+        try:
+            receivers, messages = read_transaction_file(self.id)
+        except FileNotFoundError:
+            # Networks may have more nodes than there are input files
+            logging.warning(f"No input/trans{self.id}.txt, not sending file transactions.")
+            return
         # receivers, messages = self.read_simple_transaction_file()
         for receiver, message in zip(receivers, messages):
 
@@ -362,6 +651,24 @@ class Node:
         with open(fpath, "w") as f:
             f.write(self.balance(add_mark=False))  
 
+        if self.tracer is not None:
+            self.tracer.export(os.path.join(log_path, "latency" + str(self.id) + ".csv"))
+
+    def profile_cmd(self, action):
+        match action:
+            case "start":
+                self.profiler.start()
+                print("Profiling started.")
+            case "stop":
+                self.profiler.stop()
+                print("Profiling stopped.")
+            case "dump":
+                path_prefix = os.path.join(Constants.SRC_PATH, "logs", "profile" + str(self.id))
+                if not self.profiler.dump(path_prefix):
+                    print("Nothing has been profiled. Start with \'profile start\'.")
+            case _:
+                print("[Error] Usage: profile start|stop|dump")
+
     def waiting_tx_fees(self):
         """
         How many fees have been paid for the transactions this node has received.
@@ -369,11 +676,11 @@ class Node:
         """
         fees = 0
         for tx in self.transactions:
-            match tx["contents"]["type"]:
+            match tx.type:
                 case TransactionType.AMOUNT.value:
-                    fees += tx["contents"]["amount"] * (Constants.TRANSFER_FEE_MULTIPLIER - 1)
+                    fees += tx.amount * (Constants.TRANSFER_FEE_MULTIPLIER - 1)
                 case TransactionType.MESSAGE.value:
-                    fees += len(tx["contents"]["message"])
+                    fees += len(tx.message)
         return fees
 
     def balance(self, add_mark=True):
@@ -420,7 +727,7 @@ class Node:
         # lstrip to remove leading whitespace, if any
         items = line.lstrip().split(" ")
         command_name = items[0]
-        if len(self.all_nodes) != Constants.MAX_NODES and command_name != "help":
+        if len(self.all_nodes) != Constants.MAX_NODES and command_name not in ("help", "profile"):
             print("Bootstrap phase is not yet completed.")
             return
         match command_name:
@@ -450,8 +757,8 @@ class Node:
 
                 for i, tx in enumerate(self.transactions):
                     s += tx_str(tx, True)
-                    if tx["contents"]["type"] == TransactionType.MESSAGE.value:
-                        len_sum += len(tx["contents"]["message"])
+                    if tx.type == TransactionType.MESSAGE.value:
+                        len_sum += len(tx.message)
                 print(s)
                 print(f"Sum of lengths of messages = {len_sum}")
                 print(f"TX List length = {len(self.transactions)}")
@@ -460,6 +767,13 @@ class Node:
             case "logs":
                 self.dump_logs()
                 print("Dumped logs.")
+            case "latency":
+                if self.tracer is None:
+                    print("Transaction tracing is disabled (TX_TRACING).")
+                else:
+                    print(self.tracer.report())
+            case "profile":
+                self.profile_cmd(items[1] if len(items) > 1 else "")
             case  "help":
                 print("""
     t <recipient_address> <amount>
@@ -505,6 +819,16 @@ class Node:
         
     logs
         Creates log files (under /logs directory) based on the current state of the blockchain. Used for debugging purposes.
+        Includes latency<id>.csv, with the times each transaction was created, received, minted and applied at this node.
+
+    latency
+        Prints percentiles of the time transactions took between each two stages (created, received, minted,
+        applied) at this node. Run latency.py on the logs of all nodes for end-to-end latencies.
+
+    profile start|stop|dump
+        Samples the stacks of the request handlers and the minting thread, e.g. in the middle of a benchmark run.
+        start discards any previous samples and starts profiling, stop pauses it. dump writes the samples of
+        each role to logs/profile<id>_<role>.txt (roles: handlers, minting), per thread, and prints its top functions.
 
                 """)
             case _:
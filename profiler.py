@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+from collections import Counter
+from threading import Lock, Thread, current_thread, get_ident
+
+from constants import Constants
+
+
+class Profiler:
+    """
+    Sampling profiler of the request handlers and the minting thread of a
+    live node, toggled with the `profile start|stop|dump` commands.
+    The profiled code runs in sections of a role (handlers, minting). While
+    profiling is on, a thread samples the stacks of the threads that are in
+    a section every PROFILE_SAMPLE_INTERVAL seconds, with sys._current_frames.
+    Unlike cProfile, which only sees the thread that enabled it and allows a
+    single active profiler per process from Python 3.12 on, this covers any
+    number of threads; entering and leaving a section only updates a dict.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.lock = Lock()
+        # thread ident -> (role, thread name) of the threads in a section
+        self.sections = {}
+        # role -> Counter of (thread name, stack) -> samples; stacks are
+        # tuples of function names, from the outermost frame
+        self.samples = {}
+        # Sampling rounds since start, and the interval between them
+        self.rounds = 0
+        self.interval = Constants.PROFILE_SAMPLE_INTERVAL
+        # Incremented by start and stop, so that a sampling thread of an
+        # earlier start stops even if profiling was restarted meanwhile
+        self.generation = 0
+        # code object -> function name, as shown in the profiles
+        self.names = {}
+
+    def start(self):
+        """ Starts profiling, discarding the samples collected so far """
+        with self.lock:
+            self.generation += 1
+            self.samples = {}
+            self.rounds = 0
+            self.interval = Constants.PROFILE_SAMPLE_INTERVAL
+            self.active = True
+            Thread(target=self.sample_loop, args=[self.generation], daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            self.generation += 1
+            self.active = False
+
+    def begin(self, role):
+        """
+        Marks the calling thread as being in a section of role, if profiling
+        is on. Returns the section to pass to end (None if not profiled).
+        """
+        if not self.active:
+            return None
+        ident = get_ident()
+        # Nested sections are profiled as part of the outer one
+        if ident in self.sections:
+            return None
+        self.sections[ident] = (role, current_thread().name)
+        return ident
+
+    def end(self, section):
+        if section is not None:
+            self.sections.pop(section, None)
+
+    def section(self, role):
+        """ Context manager that profiles its block as a section of role """
+        return Section(self, role)
+
+    def wrap(self, role, fn):
+        """ fn, profiled as a section of role """
+        def profiled(*args, **kwargs):
+            with self.section(role):
+                return fn(*args, **kwargs)
+        return profiled
+
+    def name(self, code):
+        name = self.names.get(code)
+        if name is None:
+            name = self.names[code] = f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+        return name
+
+    def sample_loop(self, generation):
+        while self.generation == generation:
+            self.sample(generation)
+            time.sleep(self.interval)
+
+    def sample(self, generation):
+        """ Records the stacks of the threads that are in a section """
+        frames = sys._current_frames()
+        stacks = []
+        for ident, (role, thread_name) in self.sections.copy().items():
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                stack.append(self.name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                stacks.append((role, thread_name, tuple(stack)))
+        with self.lock:
+            if self.generation != generation:
+                return
+            self.rounds += 1
+            for role, thread_name, stack in stacks:
+                self.samples.setdefault(role, Counter())[(thread_name, stack)] += 1
+
+    def summary(self, role, counts, lines):
+        """ The functions of role with the most samples at the top of the stack """
+        own = Counter()
+        total = Counter()
+        threads = set()
+        for (thread_name, stack), n in counts.items():
+            threads.add(thread_name)
+            own[stack[-1]] += n
+            for name in set(stack):
+                total[name] += n
+        samples = sum(counts.values())
+        s  = f"Profile of {role}: {samples} samples of {len(threads)} threads, every {self.interval * 1000:g} ms\n"
+        s += "  own %  total %  function\n"
+        for name, n in own.most_common(lines):
+            s += f"{100 * n / samples:7.1f} {100 * total[name] / samples:8.1f}  {name}\n"
+        return s
+
+    def dump(self, path_prefix, lines=15):
+        """
+        Writes the samples of each role to <path_prefix>_<role>.txt, one line
+        per thread and stack in the collapsed stack format ("thread;outer;...;
+        inner <samples>", read by flamegraph.pl and speedscope), and prints the
+        functions with the most own samples. Returns the paths written.
+        """
+        with self.lock:
+            samples = {role: Counter(counts) for role, counts in self.samples.items()}
+        paths = []
+        for role, counts in samples.items():
+            path = f"{path_prefix}_{role}.txt"
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                for (thread_name, stack), n in counts.items():
+                    f.write(";".join((thread_name.replace(";", ","),) + stack) + f" {n}\n")
+            paths.append(path)
+            print(f"Samples of {role}: {path}")
+            print(self.summary(role, counts, lines))
+        return paths
+
+
+class Section:
+    def __init__(self, profiler, role):
+        self.profiler = profiler
+        self.role = role
+
+    def __enter__(self):
+        self.section = self.profiler.begin(self.role)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.end(self.section)
+        return False
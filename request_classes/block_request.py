@@ -1,4 +1,5 @@
 from block import Block
+from transaction import Transaction
 
 
 class BlockRequest:
@@ -14,27 +15,8 @@ class BlockRequest:
 
     @classmethod
     def from_request_to_block(cls, request):
-        # Read the block's transactions...
-        block_txs = request["transactions"]
-        # ...and parse them into this list
-        transactions = []
-        for tx in block_txs:
-            tx_contents = tx["contents"]
-            tx_hash = tx["hash"]
-            tx_sign = tx["sign"]
-            contents = {
-                "sender_addr": tx_contents["sender_addr"],
-                "recv_addr": tx_contents["recv_addr"],
-                "type": tx_contents["type"],
-                "amount": tx_contents["amount"],
-                "message": tx_contents["message"],
-                "nonce": tx_contents["nonce"]
-            }
-            transactions.append({
-                "contents": contents,
-                "hash": tx_hash,
-                "sign": tx_sign
-            })
+        # Parse the block's transactions, keeping only the expected fields
+        transactions = [Transaction.from_dict(tx) for tx in request["transactions"]]
 
         return (Block(
             request["index"],
@@ -1,5 +1,4 @@
-import json
-from block import Block
+from request_classes.block_request import BlockRequest
 
 class BlockchainRequest:
     """
@@ -9,41 +8,9 @@ class BlockchainRequest:
 
     @classmethod
     def from_blockchain_to_request(cls, blockchain):
-        request = [block.contents(include_hash=True) for block in blockchain.blocks]
+        request = [block.contents(include_hash=True) for block in blockchain]
         return request
 
     @classmethod
     def from_request_to_blocks(cls, request):
-        blocks = []
-        for block in request:
-            # Read the block's transactions...
-            block_txs = block["transactions"]
-            # ...and parse them into this list
-            transactions = []
-            for tx in block_txs:
-                tx_contents = tx["contents"]
-                tx_hash = tx["hash"]
-                tx_sign = tx["sign"]
-                contents = {
-                    "sender_addr": tx_contents["sender_addr"],
-                    "recv_addr": tx_contents["recv_addr"],
-                    "type": tx_contents["type"],
-                    "amount": tx_contents["amount"],
-                    "message": tx_contents["message"],
-                    "nonce": tx_contents["nonce"]
-                }
-                transactions.append({
-                    "contents": contents,
-                    "hash": tx_hash,
-                    "sign": tx_sign
-                })
-
-            blocks.append(Block(
-                block["index"],
-                block["timestamp"],
-                transactions,
-                block["validator"],
-                block["prev_hash"],
-                block["hash"]
-            ))
-        return blocks
\ No newline at end of file
+        return [BlockRequest.from_request_to_block(block) for block in request]
@@ -0,0 +1,166 @@
+import struct
+from base64 import b64encode, b64decode
+from block import Block
+from transaction import Transaction
+
+# Address stored inline instead of as a node id
+INLINE_ADDR = 0xFFFF
+HAS_AMOUNT = 1
+HAS_MESSAGE = 2
+PREV_HASH_STR = 0
+PREV_HASH_INT = 1
+
+
+class CompactCodec:
+    """
+    Binary encoding of the transactions and blocks sent between nodes, used
+    instead of JSON when Constants.WIRE_FORMAT is "compact".
+    Public keys of known nodes are replaced by their node id, hashes and
+    signatures are sent as raw bytes and numbers as fixed-size big-endian
+    fields. Decoding produces the same Transactions and Blocks as the JSON requests.
+    """
+
+    def __init__(self, key_to_id, id_to_key):
+        # key_to_id(public_key) returns a node id or None,
+        # id_to_key(node_id) returns the public key of a node.
+        self.key_to_id = key_to_id
+        self.id_to_key = id_to_key
+
+    def encode(self, endpoint, request_body):
+        """ Encodes the body of a request to endpoint, or returns None if it has no compact form """
+        match endpoint:
+            case "/transactions":
+                return self.encode_tx(request_body)
+            case "/transactions/batch":
+                return self.encode_txs(request_body)
+            case "/blocks":
+                return self.encode_block(request_body)
+            case _:
+                return None
+
+    # Encoding
+
+    def encode_tx(self, tx):
+        buf = bytearray()
+        self._put_tx(buf, tx)
+        return bytes(buf)
+
+    def encode_txs(self, txs):
+        buf = bytearray(struct.pack("!I", len(txs)))
+        for tx in txs:
+            self._put_tx(buf, tx)
+        return bytes(buf)
+
+    def encode_block(self, b):
+        buf = bytearray(struct.pack("!Id", b.idx, b.timestamp))
+        self._put_addr(buf, b.validator)
+        prev_hash = b.prev_hash
+        if isinstance(prev_hash, int):
+            # The genesis block points to the integer 1
+            buf += struct.pack("!Bq", PREV_HASH_INT, prev_hash)
+        else:
+            buf += struct.pack("!B", PREV_HASH_STR)
+            self._put_b64(buf, prev_hash)
+        self._put_b64(buf, b.block_hash)
+        buf += struct.pack("!I", len(b.transactions))
+        for tx in b.transactions:
+            self._put_tx(buf, tx)
+        return bytes(buf)
+
+    def _put_addr(self, buf, public_key):
+        node_id = self.key_to_id(public_key)
+        if node_id is None:
+            key_bytes = bytes(public_key, "ascii")
+            buf += struct.pack("!HH", INLINE_ADDR, len(key_bytes))
+            buf += key_bytes
+        else:
+            buf += struct.pack("!H", node_id)
+
+    def _put_b64(self, buf, s):
+        raw = b64decode(s)
+        buf += struct.pack("!H", len(raw))
+        buf += raw
+
+    def _put_tx(self, buf, tx):
+        self._put_addr(buf, tx.sender_addr)
+        self._put_addr(buf, tx.recv_addr)
+        flags = (HAS_AMOUNT if tx.amount is not None else 0) \
+            | (HAS_MESSAGE if tx.message is not None else 0)
+        buf += struct.pack("!cBQ", bytes(tx.type, "ascii"), flags, tx.nonce)
+        if tx.amount is not None:
+            buf += struct.pack("!d", tx.amount)
+        if tx.message is not None:
+            msg = bytes(tx.message, "utf-8")
+            buf += struct.pack("!I", len(msg))
+            buf += msg
+        self._put_b64(buf, tx.hash)
+        self._put_b64(buf, tx.sign)
+
+    # Decoding
+
+    def decode_tx(self, data):
+        tx, _ = self._get_tx(data, 0)
+        return tx
+
+    def decode_txs(self, data):
+        (count,) = struct.unpack_from("!I", data, 0)
+        offset = 4
+        txs = []
+        for _ in range(count):
+            tx, offset = self._get_tx(data, offset)
+            txs.append(tx)
+        return txs
+
+    def decode_block(self, data):
+        idx, timestamp = struct.unpack_from("!Id", data, 0)
+        offset = 12
+        validator, offset = self._get_addr(data, offset)
+        (prev_hash_kind,) = struct.unpack_from("!B", data, offset)
+        offset += 1
+        if prev_hash_kind == PREV_HASH_INT:
+            (prev_hash,) = struct.unpack_from("!q", data, offset)
+            offset += 8
+        else:
+            prev_hash, offset = self._get_b64(data, offset)
+        block_hash, offset = self._get_b64(data, offset)
+        (count,) = struct.unpack_from("!I", data, offset)
+        offset += 4
+        transactions = []
+        for _ in range(count):
+            tx, offset = self._get_tx(data, offset)
+            transactions.append(tx)
+        return Block(idx, timestamp, transactions, validator, prev_hash, block_hash)
+
+    def _get_addr(self, data, offset):
+        (node_id,) = struct.unpack_from("!H", data, offset)
+        offset += 2
+        if node_id != INLINE_ADDR:
+            return self.id_to_key(node_id), offset
+        (length,) = struct.unpack_from("!H", data, offset)
+        offset += 2
+        return data[offset:offset+length].decode("ascii"), offset + length
+
+    def _get_b64(self, data, offset):
+        (length,) = struct.unpack_from("!H", data, offset)
+        offset += 2
+        return b64encode(data[offset:offset+length]).decode(), offset + length
+
+    def _get_tx(self, data, offset):
+        sender_addr, offset = self._get_addr(data, offset)
+        recv_addr, offset = self._get_addr(data, offset)
+        trans_type, flags, nonce = struct.unpack_from("!cBQ", data, offset)
+        offset += 10
+        amount = None
+        message = None
+        if flags & HAS_AMOUNT:
+            (amount,) = struct.unpack_from("!d", data, offset)
+            offset += 8
+        if flags & HAS_MESSAGE:
+            (length,) = struct.unpack_from("!I", data, offset)
+            offset += 4
+            message = data[offset:offset+length].decode("utf-8")
+            offset += length
+        tx_hash, offset = self._get_b64(data, offset)
+        tx_sign, offset = self._get_b64(data, offset)
+        tx = Transaction(sender_addr, recv_addr, trans_type.decode("ascii"), amount, message, nonce, tx_hash, tx_sign)
+        return tx, offset
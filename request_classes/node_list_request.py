@@ -3,25 +3,35 @@ from node import NodeInfo
 class NodeListRequest:
     """
     This is the request made from Boostrap node after bootstrap phase is complete.
-    It contains a list of all the nodes that entered the network (including bootstrap).
+    It contains a list of all the nodes that entered the network (including bootstrap)
+    and the network parameters (see config.NETWORK_PARAMS).
     """
 
     @classmethod
-    def from_node_info_dict_to_request(cls, nodes_info: dict[int, NodeInfo]):
-        request = []
+    def from_node_info_dict_to_request(cls, nodes_info: dict[int, NodeInfo], config=None):
+        nodes = []
         for node_id, node_info in nodes_info.items():
-            request.append({
+            nodes.append({
                 "ip_address": node_info.ip_address,
                 "port": node_info.port,
                 "public_key": node_info.public_key,
                 "id": node_id
             })
-        return request
+        return {"nodes": nodes, "config": config}
+
+    @classmethod
+    def nodes(cls, request):
+        # Older bootstrap nodes send the list only
+        return request if isinstance(request, list) else request["nodes"]
+
+    @classmethod
+    def config(cls, request):
+        return None if isinstance(request, list) else request.get("config")
 
     @classmethod
     def from_request_to_node_info_dict(cls, request):
         nodes_info = {}
-        for node in request:
+        for node in cls.nodes(request):
             nodes_info[node["id"]] = NodeInfo(node["ip_address"],
                                               node["port"],
                                               node["public_key"],
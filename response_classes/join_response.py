@@ -4,12 +4,14 @@ from helper import JSONSerializable
 class JoinResponse(JSONSerializable):
     """
         This is the response returned by the Boostrap node to a node that requested to enter the network.
-        It contains the id assigned to the new node.
+        It contains the id assigned to the new node and the network parameters
+        (see config.NETWORK_PARAMS).
     """
-    def __init__(self, id):
+    def __init__(self, id, config=None):
         self.id = id
+        self.config = config
 
     @classmethod
     def from_json(cls, json_data):
-        return cls(json_data.get('id'))
+        return cls(json_data.get('id'), json_data.get('config'))
 
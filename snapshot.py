@@ -0,0 +1,106 @@
+import os
+import json
+import logging
+
+# Snapshot files are named snapshot-<height>.json, zero-padded so that
+# sorting the names sorts them by height.
+SNAPSHOT_PREFIX = "snapshot-"
+SNAPSHOT_SUFFIX = ".json"
+
+
+class Snapshot:
+    """
+    The hard state of a node (validated balances, stakes and nonces) after
+    the block with index height, together with what a restarting node needs
+    to resume without rejoining the network: its id and the node list.
+    block_hash is the hash of the block at height, used to check that the
+    snapshot belongs to the stored chain.
+    """
+
+    def __init__(self, height, block_hash, node_id, nodes, hard_bcc, hard_stakes, hard_nonce, config=None):
+        self.height = height
+        self.block_hash = block_hash
+        self.node_id = node_id
+        # List of {"id", "ip_address", "port", "public_key"} dicts
+        self.nodes = nodes
+        self.hard_bcc = hard_bcc
+        self.hard_stakes = hard_stakes
+        self.hard_nonce = hard_nonce
+        # The network parameters (see config.NETWORK_PARAMS)
+        self.config = config
+
+    def to_dict(self):
+        return {
+            "height": self.height,
+            "block_hash": self.block_hash,
+            "node_id": self.node_id,
+            "nodes": self.nodes,
+            "hard_bcc": self.hard_bcc,
+            "hard_stakes": self.hard_stakes,
+            "hard_nonce": self.hard_nonce,
+            "config": self.config,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        # JSON object keys are strings, node ids are ints
+        def by_id(state):
+            return {int(node_id): v for node_id, v in state.items()}
+
+        return cls(
+            d["height"],
+            d["block_hash"],
+            d["node_id"],
+            d["nodes"],
+            by_id(d["hard_bcc"]),
+            by_id(d["hard_stakes"]),
+            by_id(d["hard_nonce"]),
+            d.get("config"),
+        )
+
+    def save(self, path, keep=2):
+        """
+        Writes the snapshot to path/snapshot-<height>.json and deletes all but
+        the `keep` most recent snapshots. The file is written under a temporary
+        name and renamed, so a crash never leaves a partial snapshot behind.
+        """
+        os.makedirs(path, exist_ok=True)
+        fname = os.path.join(path, "{}{:010d}{}".format(SNAPSHOT_PREFIX, self.height, SNAPSHOT_SUFFIX))
+        tmp_fname = fname + ".tmp"
+        with open(tmp_fname, "w") as f:
+            json.dump(self.to_dict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_fname, fname)
+
+        for old in snapshot_files(path)[:-keep]:
+            os.remove(os.path.join(path, old))
+
+    @classmethod
+    def latest(cls, path):
+        """ Loads the snapshot with the greatest height in path, or returns None """
+        if not os.path.isdir(path):
+            return None
+        fnames = snapshot_files(path)
+        if not fnames:
+            return None
+        with open(os.path.join(path, fnames[-1]), "r") as f:
+            snapshot = cls.from_dict(json.load(f))
+        logging.info(f"[SNAPSHOT] Loaded snapshot of height {snapshot.height} from {path}")
+        return snapshot
+
+
+def clear_snapshots(path):
+    """ Deletes the snapshots in path, e.g. those of a previous run of the node """
+    if not os.path.isdir(path):
+        return
+    for fname in snapshot_files(path):
+        os.remove(os.path.join(path, fname))
+
+
+def snapshot_files(path):
+    """ Names of the snapshot files in path, oldest first """
+    return sorted(
+        fname for fname in os.listdir(path)
+        if fname.startswith(SNAPSHOT_PREFIX) and fname.endswith(SNAPSHOT_SUFFIX)
+    )
@@ -0,0 +1,217 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+
+# Histogram buckets in seconds, from lock waits to slow broadcasts
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def format_labels(names, values, extra=""):
+    pairs = ['{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A metric in the Prometheus text format, with one series per combination
+    of label values. Label values are given as keyword arguments.
+    """
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series = {}
+        self.lock = Lock()
+
+    def key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            series = list(self.series.items())
+        for key, value in series:
+            lines += self.render_series(key, value)
+        return lines
+
+    def render_series(self, key, value):
+        return [f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """ A value that goes up and down. With fn, it is read by calling fn() on every scrape. """
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.series[self.key(labels)] = value
+
+    def render(self):
+        if self.fn is not None:
+            with self.lock:
+                self.series[()] = self.fn()
+        return super().render()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        # Counts per bucket (not cumulative), with a last one for +Inf
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """ Context manager that observes the time spent in its block """
+        return Timer(self, labels)
+
+    def render(self):
+        # Copy the counts, which observe keeps updating
+        with self.lock:
+            series = [(key, (list(counts), total, count)) for key, (counts, total, count) in self.series.items()]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="{}"'.format(format_value(bound) if bound == float("inf") else bound)
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """ All metrics in the Prometheus text exposition format """
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+class TimedLock:
+    """
+    A threading.Lock that records how long acquire waited in a histogram.
+    An uncontended acquire records a wait of zero without reading the clock.
+    """
+
+    def __init__(self, histogram, name):
+        self.lock = Lock()
+        self.histogram = histogram
+        self.name = name
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            self.histogram.observe(0, lock=self.name)
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        self.histogram.observe(time.perf_counter() - start, lock=self.name)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class NodeMetrics:
+    """
+    The metrics of a node, served at GET /metrics. Gauges are read from the
+    node when scraped; the rest are updated on the hot paths.
+    """
+
+    def __init__(self, node):
+        self.registry = Registry()
+        add = self.registry.add
+        self.txs_received = add(Counter(
+            "blockchat_txs_received_total", "Transactions received from peers, by result", ["result"]))
+        self.tx_receive_seconds = add(Histogram(
+            "blockchat_tx_receive_seconds", "Time to handle a request with received transactions", ["endpoint"]))
+        self.tx_verify_seconds = add(Histogram(
+            "blockchat_tx_verify_seconds", "Time to verify the signatures of a set of transactions"))
+        self.block_process_seconds = add(Histogram(
+            "blockchat_block_process_seconds", "Time to validate and apply a received block"))
+        self.lock_wait_seconds = add(Histogram(
+            "blockchat_lock_wait_seconds", "Time spent waiting for a node lock", ["lock"]))
+        self.post_seconds = add(Histogram(
+            "blockchat_post_seconds", "Round trip time of requests to a peer", ["peer", "endpoint"]))
+        self.blocks = add(Counter(
+            "blockchat_blocks_total", "Blocks appended to the chain, by validator id", ["validator"]))
+        add(Gauge("blockchat_chain_length", "Blocks in the chain, including the genesis block",
+                  fn=lambda: len(node.blockchain)))
+        add(Gauge("blockchat_mempool_transactions", "Received transactions not yet in a block",
+                  fn=lambda: len(node.transactions)))
+        add(Gauge("blockchat_pending_blocks", "Blocks received ahead of the chain",
+                  fn=lambda: len(node.pending_blocks)))
+
+    def render(self):
+        return self.registry.render()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import sys
 import yaml
+import config
 from constants import Constants
 
 def val_identical_blockchains():
@@ -33,6 +34,8 @@ def val_no_dup_tx(blockchain):
     return (-1, -1)
 
 if __name__ == "__main__":
+    # MAX_NODES as set in the config file or environment of the run
+    config.load()
     blockchain =  val_identical_blockchains()
     if blockchain is None:
         print("[ERROR] Blockchains are not the same! :(")
@@ -0,0 +1,87 @@
+import csv
+import time
+import statistics
+from collections import OrderedDict
+from threading import Lock
+
+# Stages of a transaction, in order, as seen by one node:
+# created  - created by this node (create_tx)
+# received - received from the node that created it
+# minted   - put in a block minted by this node
+# applied  - the block containing it was applied to this node's hard state
+STAGES = ("created", "received", "minted", "applied")
+STAGE_INDEX = {stage: i for i, stage in enumerate(STAGES)}
+
+
+def percentiles(values):
+    """ p50, p90, p99 and max of values """
+    if len(values) == 1:
+        return values[0], values[0], values[0], values[0]
+    qs = statistics.quantiles(values, n=100, method="inclusive")
+    return qs[49], qs[89], qs[98], max(values)
+
+
+def format_report(intervals):
+    """ Table of the percentiles of {(label): [seconds]}, in milliseconds """
+    s  = "Interval                       Count   p50 (ms)   p90 (ms)   p99 (ms)   max (ms)\n"
+    s += "================================================================================\n"
+    for label, values in intervals.items():
+        if not values:
+            continue
+        p50, p90, p99, top = (v * 1000 for v in percentiles(values))
+        s += f"{label:<30} {len(values):6} {p50:10.1f} {p90:10.1f} {p99:10.1f} {top:10.1f}\n"
+    return s
+
+
+class TxTracer:
+    """
+    Records when each transaction reaches each of STAGES at this node, keyed
+    by tx hash, to find where the latency of transactions goes. Only the
+    most recent max_txs transactions are kept. The export files of all nodes
+    are combined by latency.py into end-to-end latencies; the nodes' clocks
+    are assumed to be in sync (e.g. all nodes on one host).
+    """
+
+    def __init__(self, max_txs):
+        self.max_txs = max_txs
+        # tx hash -> timestamp per stage (None if not reached here)
+        self.txs = OrderedDict()
+        self.lock = Lock()
+
+    def record(self, stage, tx_hashes):
+        t = time.time()
+        i = STAGE_INDEX[stage]
+        with self.lock:
+            for tx_hash in tx_hashes:
+                stamps = self.txs.get(tx_hash)
+                if stamps is None:
+                    stamps = self.txs[tx_hash] = [None] * len(STAGES)
+                    if len(self.txs) > self.max_txs:
+                        self.txs.popitem(last=False)
+                stamps[i] = t
+
+    def intervals(self):
+        """ Durations between every two stages reached by the same transaction """
+        with self.lock:
+            all_stamps = list(self.txs.values())
+        intervals = OrderedDict()
+        for a in range(len(STAGES)):
+            for b in range(a + 1, len(STAGES)):
+                intervals[f"{STAGES[a]} -> {STAGES[b]}"] = [
+                    stamps[b] - stamps[a] for stamps in all_stamps
+                    if stamps[a] is not None and stamps[b] is not None
+                ]
+        return intervals
+
+    def report(self):
+        return format_report(self.intervals())
+
+    def export(self, path):
+        """ Writes a CSV file with a line of stage timestamps per transaction """
+        with self.lock:
+            rows = [(tx_hash, list(stamps)) for tx_hash, stamps in self.txs.items()]
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("hash",) + STAGES)
+            for tx_hash, stamps in rows:
+                writer.writerow([tx_hash] + ["" if t is None else repr(t) for t in stamps])
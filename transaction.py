@@ -1,6 +1,8 @@
 import json
-import struct
 from enum import Enum
+from threading import Lock
+from collections import OrderedDict
+from functools import lru_cache
 from base64 import b64encode, b64decode
 from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.primitives import hashes
@@ -18,6 +20,82 @@ class TransactionType(Enum):
     STAKE = "s"
 
 
+class Transaction:
+    """
+    A signed transaction. The canonical bytes of its contents (which are hashed
+    and signed), their digest and the JSON of the whole transaction are
+    computed once, when first needed, and reused for hashing, verification
+    and wire encoding.
+    """
+    __slots__ = ("sender_addr", "recv_addr", "type", "amount", "message", "nonce",
+                 "hash", "sign", "_bytes", "_digest", "_json")
+
+    def __init__(self, sender_addr, recv_addr, trans_type, amount, message, nonce, tx_hash=None, tx_sign=None):
+        self.sender_addr = sender_addr
+        self.recv_addr = recv_addr
+        self.type = trans_type
+        self.amount = amount
+        self.message = message
+        self.nonce = nonce
+        self.hash = tx_hash
+        self.sign = tx_sign
+        self._bytes = None
+        self._digest = None
+        self._json = None
+
+    def contents(self):
+        return {
+            "sender_addr": self.sender_addr,
+            "recv_addr": self.recv_addr,
+            "type": self.type,
+            "amount": self.amount,
+            "message": self.message,
+            "nonce": self.nonce,
+        }
+
+    def canonical_bytes(self) -> bytes:
+        """ The bytes that are hashed and signed: the JSON of the contents """
+        if self._bytes is None:
+            self._bytes = dict_bytes(self.contents())
+        return self._bytes
+
+    def digest(self) -> bytes:
+        """ SHA256 of the canonical bytes, i.e. what the hash field should decode to """
+        if self._digest is None:
+            self._digest = sha256hash(self.canonical_bytes())
+        return self._digest
+
+    def to_dict(self):
+        return {
+            "contents": self.contents(),
+            "hash": self.hash,
+            "sign": self.sign
+        }
+
+    def to_json(self) -> str:
+        if self._json is None:
+            self._json = '{{"contents": {}, "hash": {}, "sign": {}}}'.format(
+                self.canonical_bytes().decode("ascii"),
+                json.dumps(self.hash),
+                json.dumps(self.sign)
+            )
+        return self._json
+
+    @classmethod
+    def from_dict(cls, tx):
+        tx_contents = tx["contents"]
+        return cls(
+            tx_contents["sender_addr"],
+            tx_contents["recv_addr"],
+            tx_contents["type"],
+            tx_contents["amount"],
+            tx_contents["message"],
+            tx_contents["nonce"],
+            tx["hash"],
+            tx["sign"]
+        )
+
+
 class TransactionBuilder:
 
     def __init__(self, wallet):
@@ -38,51 +116,77 @@ class TransactionBuilder:
             msg = None
             amount = float(payload)
 
-        tx_contents = {
-            "sender_addr": self.sender_addr,
-            "recv_addr": recv_addr,
-            "type": trans_type,
-            "amount": amount,
-            "message": msg,
-            "nonce": self.nonce,
-        }
+        tx = Transaction(self.sender_addr, recv_addr, trans_type, amount, msg, self.nonce)
+        tx.hash = b64encode(tx.digest()).decode()
+        tx.sign = b64encode(self.wallet.sign(tx.canonical_bytes())).decode()
 
-        tx_str = json.dumps(tx_contents)
-        tx_bytes = struct.pack("!" + str(len(tx_str)) + "s", bytes(tx_str, "ascii"))
+        self.nonce += 1
 
-        tx_hash = sha256hash(tx_bytes)
-        tx_sign = self.wallet.sign(tx_bytes)
+        return tx
 
-        tx = {
-            "contents": tx_contents,
-            "hash": b64encode(tx_hash).decode(),
-            "sign": b64encode(tx_sign).decode()
-        }
+# Cache of load_pubkey, created on first use rather than at import time,
+# so that PUBKEY_CACHE_SIZE can be set by config.load
+_pubkey_cache = None
 
-        self.nonce += 1
+def load_pubkey(public_key: str):
+    """
+    Parses an OpenSSH public key string into a key object. Parsing is costly
+    compared to verifying a signature, so the PUBKEY_CACHE_SIZE most recently
+    used keys are cached.
+    """
+    global _pubkey_cache
+    if _pubkey_cache is None:
+        _pubkey_cache = lru_cache(maxsize=Constants.PUBKEY_CACHE_SIZE)(parse_pubkey)
+    return _pubkey_cache(public_key)
 
-        return tx
+def parse_pubkey(public_key: str):
+    return load_ssh_public_key(bytes(public_key, "ascii"))
 
-def verify_tx(tx, expected_nonce) -> bool:
-    tx_bytes = dict_bytes(tx["contents"])
-    my_hash = sha256hash(tx_bytes)
+def cache_pubkeys(public_keys):
+    """ Populates the key object cache, e.g. when the node list is received """
+    for public_key in public_keys:
+        load_pubkey(public_key)
 
-    if b64decode(tx["hash"]) != my_hash:
-        print("[Received Transaction] Hash mismatch detected!")
-        return False
+class VerifiedTxCache:
+    """
+    The (hash, signature) pairs of transactions whose signature this node has
+    already verified, so that each signature is checked once per node.
+    A transaction is evicted once it is included in a finalized block or is
+    rejected. Beyond max_size pairs, the least recently added ones are
+    evicted too, so a pair that is never finalized (e.g. of a transaction in
+    a block that was dropped) is only verified again if seen again.
+    """
 
-    if tx["contents"]["nonce"] < expected_nonce:
-        print("[Received Transaction] Invalid nonce detected: EXP = {} GOT = {} SENDER = {}! (possible replay attack)".format(expected_nonce, tx["contents"]["nonce"], tx["contents"]["sender_addr"][100:110]))
-        return False
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._verified = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._verified)
+
+    def __contains__(self, tx):
+        return (tx.hash, tx.sign) in self._verified
+
+    def add(self, tx):
+        with self._lock:
+            self._verified[(tx.hash, tx.sign)] = None
+            self._verified.move_to_end((tx.hash, tx.sign))
+            if len(self._verified) > self.max_size:
+                self._verified.popitem(last=False)
 
+    def evict(self, tx):
+        with self._lock:
+            self._verified.pop((tx.hash, tx.sign), None)
 
-    sender_pubkey = load_ssh_public_key(bytes(tx["contents"]["sender_addr"], "ascii"))
-    sign = b64decode(tx["sign"])
+def verify_signature(tx) -> bool:
+    sender_pubkey = load_pubkey(tx.sender_addr)
+    sign = b64decode(tx.sign)
 
     try:
         sender_pubkey.verify(
             sign,
-            tx_bytes,
+            tx.canonical_bytes(),
             padding.PSS(
                 mgf=padding.MGF1(hashes.SHA256()),
                 salt_length=padding.PSS.MAX_LENGTH
@@ -94,15 +198,66 @@ def verify_tx(tx, expected_nonce) -> bool:
         print("[Received Transaction] Invalid signature detected!")
         return False
 
-def tx_cost(tx_contents, sender_stakes):
+def verify_tx(tx, expected_nonce, verified=None) -> bool:
+    """
+    Checks the hash, nonce and signature of a transaction. If a VerifiedTxCache
+    is given, the signature is only checked if the (hash, signature) pair is
+    not in it, and is added to it when valid.
+    The hash is always compared, as it binds the cached pair to the contents.
+    """
+    if b64decode(tx.hash) != tx.digest():
+        print("[Received Transaction] Hash mismatch detected!")
+        return False
+
+    if tx.nonce < expected_nonce:
+        print("[Received Transaction] Invalid nonce detected: EXP = {} GOT = {} SENDER = {}! (possible replay attack)".format(expected_nonce, tx.nonce, tx.sender_addr[100:110]))
+        return False
+
+    if verified is not None and tx in verified:
+        return True
+
+    if not verify_signature(tx):
+        return False
+
+    if verified is not None:
+        verified.add(tx)
+    return True
+
+def check_hash_and_signature(tx) -> bool:
+    if b64decode(tx.hash) != tx.digest():
+        print("[Received Transaction] Hash mismatch detected!")
+        return False
+    return verify_signature(tx)
+
+def verify_tx_batch(txs, pool, verified) -> bool:
+    """
+    Checks the hashes and signatures of a batch of transactions on the workers
+    of a thread pool. Nonces and balances are left to the sequential application
+    of the transactions. Valid transactions are added to the verified cache,
+    so that the following verify_tx calls skip their signatures.
+    Returns True if all transactions were valid.
+    """
+    unchecked = [tx for tx in txs if tx not in verified]
+    # A single transaction is not worth the hand-off to the pool
+    results = pool.map(check_hash_and_signature, unchecked) if len(unchecked) > 1 \
+        else [check_hash_and_signature(tx) for tx in unchecked]
+    all_valid = True
+    for tx, valid in zip(unchecked, results):
+        if valid:
+            verified.add(tx)
+        else:
+            all_valid = False
+    return all_valid
+
+def tx_cost(tx, sender_stakes):
     # Transaction Cost
-    match tx_contents["type"]:
+    match tx.type:
         case TransactionType.MESSAGE.value:
-            transaction_cost = len(tx_contents["message"])
+            transaction_cost = len(tx.message)
         case TransactionType.AMOUNT.value:
-            transaction_cost = tx_contents["amount"] * Constants.TRANSFER_FEE_MULTIPLIER
+            transaction_cost = tx.amount * Constants.TRANSFER_FEE_MULTIPLIER
         case TransactionType.STAKE.value:
-            transaction_cost = tx_contents["amount"] - sender_stakes  # This could very well be negative
+            transaction_cost = tx.amount - sender_stakes  # This could very well be negative
         case _:
             transaction_cost = None
     return transaction_cost
@@ -0,0 +1,71 @@
+import random
+from bisect import bisect
+from itertools import accumulate
+from threading import Lock
+
+from constants import Constants
+
+
+class ValidatorSelector:
+    """
+    Proof of Stake choice of the validator of each block. The validator of
+    block idx+1 is drawn with probability proportional to the hard stakes,
+    using a PRNG seeded with the hash of block idx, so that all nodes draw
+    the same one. The result is the same as that of
+    random.seed(prev_hash); random.choices(ids, weights), but:
+    - The cumulative weights are cached and only recomputed by set_stakes,
+      which the node calls whenever its hard stakes change.
+    - Every draw uses its own random.Random, so it neither depends on nor
+      disturbs the global random state used by other threads.
+    - The draw for a hash does not depend on the stakes, so it is cached
+      too, and can be computed ahead (prepare) as soon as a block is known.
+    """
+
+    def __init__(self):
+        # (node ids, cumulative weights), replaced as a whole by set_stakes so
+        # that readers never see the ids of one version with the weights of another
+        self.weights = ([], [])
+        # prev block hash -> uniform draw in [0, 1), oldest first
+        self.draws = {}
+        self.draws_lock = Lock()
+
+    def set_stakes(self, stakes: dict):
+        ids = sorted(stakes)
+        total_stake = sum(stakes[i] for i in ids)
+        if total_stake <= 0:
+            # Nobody can be drawn; select raises until someone stakes again
+            self.weights = ([], [])
+            return
+        cum_weights = list(accumulate(stakes[i] / total_stake for i in ids))
+        self.weights = (ids, cum_weights)
+
+    def draw(self, prev_hash):
+        with self.draws_lock:
+            u = self.draws.get(prev_hash)
+        if u is not None:
+            return u
+
+        u = random.Random(prev_hash).random()
+        with self.draws_lock:
+            self.draws[prev_hash] = u
+            if len(self.draws) > Constants.VALIDATOR_DRAWS_CACHED:
+                del self.draws[next(iter(self.draws))]
+        return u
+
+    def prepare(self, prev_hashes):
+        """ Computes the draws for the blocks following the given ones ahead of time """
+        for prev_hash in prev_hashes:
+            self.draw(prev_hash)
+
+    def select(self, prev_hash):
+        """ Returns the id of the validator of the block after the one with hash prev_hash """
+        ids, cum_weights = self.weights
+        return ids[bisect(cum_weights, self.draw(prev_hash) * cum_weights[-1], 0, len(ids) - 1)]
+
+    def schedule(self, prev_hashes):
+        """
+        Returns the validator ids of the blocks following each of the given
+        ones, under the current stakes. Only holds as long as the stakes do not
+        change, i.e. until a block with a stake transaction is applied.
+        """
+        return [self.select(prev_hash) for prev_hash in prev_hashes]
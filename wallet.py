@@ -1,8 +1,8 @@
-from os import path
+import os
 from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
-from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat, PrivateFormat, NoEncryption
 from cryptography.hazmat.primitives.serialization import load_ssh_private_key
 from helper import read_pubkey
 
@@ -22,6 +22,13 @@ class Wallet:
             .public_bytes(Encoding.OpenSSH, PublicFormat.OpenSSH) \
             .decode()
 
+    def save(self, path):
+        """ Writes the private key to path in OpenSSH format, readable only by the owner """
+        key_bytes = self._key_obj.private_bytes(Encoding.PEM, PrivateFormat.OpenSSH, NoEncryption())
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key_bytes)
+
     def sign(self, msg: bytes) -> bytes:
         signature = self._key_obj.sign(
             msg,